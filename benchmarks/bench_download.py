@@ -0,0 +1,89 @@
+"""
+Download of a large dataset file from the local file stand-in (`file_stub.py`).
+
+Compares a single-stream download with the range-parallel `RangeDownloader`
+over a throttled connection, then checks that a download whose connections are
+cut resumes from the chunks already written and yields the registered file.
+
+Usage: python benchmarks/bench_download.py [--size MB] [--bandwidth MB/S] [--workers 4] [--chunk MB]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'src'))
+from file_stub import FileStub
+
+FILE_NAME = 'large.tif'
+
+
+def make_file(directory: Path, size: int) -> str:
+    """
+    Write `size` random bytes to the served directory and return their pooch hash.
+    """
+    data = os.urandom(size)
+    (directory / FILE_NAME).write_bytes(data)
+    return f'sha256:{hashlib.sha256(data).hexdigest()}'
+
+
+def make_dataset(cache: Path, base_url: str, known_hash: str):
+    from helpers.datasets import FieldGuideDataset
+
+    return FieldGuideDataset(path=cache, base_url=base_url, registry={FILE_NAME: known_hash}, retry_if_failed=2)
+
+
+def timed_fetch(dataset, downloader=None) -> float:
+    start = time.perf_counter()
+    dataset.fetch(FILE_NAME, downloader=downloader)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=float, default=96, help='Size of the file, in MB.')
+    parser.add_argument('--bandwidth', type=float, default=20, help='Bandwidth of each connection, in MB/s.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of concurrent range requests.')
+    parser.add_argument('--chunk', type=float, default=16, help='Size of the range requests, in MB.')
+    args = parser.parse_args()
+
+    import pooch
+    from helpers.downloaders import PARTIAL_DIR, RangeDownloader
+
+    chunk_size = int(args.chunk * 1e6)
+    with tempfile.TemporaryDirectory() as served, tempfile.TemporaryDirectory() as cache:
+        served, cache = Path(served), Path(cache)
+        known_hash = make_file(served, int(args.size * 1e6))
+        stub = FileStub(served, bandwidth=args.bandwidth * 1e6)
+        base_url = stub.start()
+
+        def fresh_dataset(name: str):
+            return make_dataset(cache / name, base_url, known_hash)
+
+        single = timed_fetch(fresh_dataset('single'), pooch.HTTPDownloader())
+        parallel = timed_fetch(fresh_dataset('parallel'), RangeDownloader(chunk_size, args.workers, min_range_size=0))
+        print(f'{args.size:.0f} MB at {args.bandwidth:.0f} MB/s per connection')
+        print(f'  single stream  {single:8.2f} s')
+        print(f'  {args.workers} ranges       {parallel:8.2f} s  ({single / parallel:.1f}x)')
+
+        # Cut the first responses: the retries of the fetch only request the missing chunks
+        stub.ranges.clear()
+        stub.bandwidth = None
+        stub.drop = args.workers
+        dataset = fresh_dataset('resume')
+        timed_fetch(dataset, RangeDownloader(chunk_size, args.workers, min_range_size=0))
+        n_chunks = -(-int(args.size * 1e6) // chunk_size)
+        print(f'  resumed        {len(stub.ranges)} range requests for {n_chunks} chunks '
+              f'({args.workers} responses cut)')
+        assert len(stub.ranges) <= n_chunks + args.workers, 'chunks already written were downloaded again'
+        assert not any((cache / 'resume' / PARTIAL_DIR).iterdir()), 'partial download left in the cache'
+
+        # Without range support, the downloader falls back to a single stream
+        stub.accept_ranges = False
+        timed_fetch(fresh_dataset('no-ranges'), RangeDownloader(chunk_size, args.workers, min_range_size=0))
+        print('  fallback       single stream without range support')
+
+        stub.stop()
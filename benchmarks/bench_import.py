@@ -0,0 +1,65 @@
+"""
+Time `import helpers` against a first access to the Notion dataframes.
+
+Each measurement runs in a fresh interpreter so that nothing is cached in memory.
+The helpers are pointed to the local Notion stand-in (`notion_stub.py`), with an
+empty snapshot directory for every run, so that a first access to a dataframe
+pays for a full sync of its database while `import helpers` does not.
+
+Usage: python benchmarks/bench_import.py [repeats] [--rows N] [--latency S]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from notion_stub import NotionStub
+
+SRC_DIR = Path(__file__).resolve().parents[1] / 'src'
+
+SNIPPETS = {
+    'import helpers': 'import helpers',
+    'import + DATAFRAME_SOFTWARE_TOOLS': 'import helpers; helpers.DATAFRAME_SOFTWARE_TOOLS',
+    'import + both dataframes': 'import helpers; helpers.DATAFRAME_SOFTWARE_TOOLS; helpers.DATAFRAME_ONLINE_RESOURCES',
+}
+
+def time_snippet(code: str, repeats: int, env: dict) -> list:
+    timings = []
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=SRC_DIR, env={**env, 'NOTION_CACHE': cache_dir}, check=True)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('repeats', nargs='?', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=1000, help='Number of pages of each database of the stand-in.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay added to every response, in seconds.')
+    args = parser.parse_args()
+
+    stub = NotionStub(latency=args.latency)
+    env = {
+        **os.environ,
+        'NOTION_KEY': 'stand-in',
+        'NOTION_API_URL': stub.start(),
+        'NOTION_RATE_LIMIT': '1000',
+    }
+    env.pop('NOTION_ARTIFACT_DIR', None)
+    stub.reset(args.rows)
+
+    baseline = statistics.median(time_snippet('import itables', args.repeats, env))
+    print(f'{"interpreter + itables":<40} {baseline * 1000:8.1f} ms')
+    for label, code in SNIPPETS.items():
+        timing = statistics.median(time_snippet(code, args.repeats, env))
+        print(f'{label:<40} {timing * 1000:8.1f} ms  (+{(timing - baseline) * 1000:.1f} ms)')
+
+    stub.stop()
+
+if __name__ == '__main__':
+    main()
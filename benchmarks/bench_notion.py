@@ -0,0 +1,141 @@
+"""
+End-to-end timing of `helpers` against the local Notion stand-in (`notion_stub.py`).
+
+For each catalogue size, times the fetch (full sync of a snapshot), parse, render
+and filter stages of both databases. Results can be written as JSON and compared
+against a previous run to catch regressions.
+
+Usage: python benchmarks/bench_notion.py [--rows 100 1000 10000 50000] [--latency S] [--throttle P]
+                                         [--output results.json] [--baseline results.json] [--tolerance 1.25]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'src'))
+from notion_stub import NotionStub
+
+# Tags of a typical section page
+TAGS = ['Image segmentation', 'Python']
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(stub: NotionStub, n_rows: int) -> dict:
+    # The helpers read their configuration from the environment at import
+    import helpers
+    from helpers import notion_api
+
+    stub.reset(n_rows)
+
+    databases = {
+        'online_resources': (
+            notion_api.ONLINE_RESOURCES_DATABASE_ID, notion_api.ONLINE_RESOURCES_SCHEMA,
+            notion_api.parse_online_resources, notion_api.render_online_resources,
+            helpers._online_resources_dataframe, helpers.filter_online_resources,
+        ),
+        'software_tools': (
+            notion_api.SOFTWARE_TOOLS_DATABASE_ID, notion_api.SOFTWARE_TOOLS_SCHEMA,
+            notion_api.parse_software_tools, notion_api.render_software_tools,
+            helpers._software_tools_dataframe, helpers.filter_software_tools,
+        ),
+    }
+
+    for cached in (
+        helpers._online_resources_dataframe, helpers._software_tools_dataframe,
+        helpers._online_resources_index, helpers._software_tools_index,
+        helpers._filter_online_resources, helpers._filter_software_tools,
+    ):
+        cached.cache_clear()
+
+    results = {}
+    for name, (database_id, schema, parse, render, load, filter_tags) in databases.items():
+        pages, fetch_time = timed(notion_api.sync_notion_database, database_id, schema, True)
+        data, parse_time = timed(parse, {'results': pages})
+        _, render_time = timed(lambda: render(pd.DataFrame(data)))
+        load()
+        _, filter_time = timed(filter_tags, TAGS)
+        _, memoized_filter_time = timed(filter_tags, TAGS)
+        results[name] = {
+            'fetch': fetch_time,
+            'parse': parse_time,
+            'render': render_time,
+            'filter': filter_time,
+            'filter (memoized)': memoized_filter_time,
+        }
+
+    results['requests'] = stub.requests
+    results['throttled'] = stub.throttled
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for n_rows, databases in results.items():
+        for database, stages in databases.items():
+            if not isinstance(stages, dict):
+                continue
+            for stage, seconds in stages.items():
+                reference = baseline.get(n_rows, {}).get(database, {}).get(stage)
+                # Ignore sub-millisecond stages, dominated by noise
+                if reference is not None and seconds > max(reference * tolerance, 1e-3):
+                    regressions.append(f'{n_rows} rows, {database}, {stage}: {reference:.4f}s -> {seconds:.4f}s')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay added to every response, in seconds.')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Fraction of requests answered with a 429.')
+    parser.add_argument('--rate-limit', type=float, default=1000, help='Requests per second allowed by the client.')
+    parser.add_argument('--output', type=Path, help='Write the timings to this JSON file.')
+    parser.add_argument('--baseline', type=Path, help='Fail if a stage is slower than in this JSON file.')
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    args = parser.parse_args()
+
+    stub = NotionStub(latency=args.latency, throttle=args.throttle)
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ.update({
+        'NOTION_KEY': 'stand-in',
+        'NOTION_API_URL': stub.start(),
+        'NOTION_CACHE': cache_dir.name,
+        'NOTION_RATE_LIMIT': str(args.rate_limit),
+    })
+    os.environ.pop('NOTION_ARTIFACT_DIR', None)
+
+    results = {}
+    for n_rows in args.rows:
+        results[str(n_rows)] = run(stub, n_rows)
+        for database, stages in results[str(n_rows)].items():
+            if isinstance(stages, dict):
+                timings = '  '.join(f'{stage} {seconds * 1000:9.1f} ms' for stage, seconds in stages.items())
+                print(f'{n_rows:>6} rows  {database:<17} {timings}')
+
+    stub.stop()
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
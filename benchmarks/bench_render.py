@@ -0,0 +1,49 @@
+"""
+Microbenchmark of the tag button rendering of the Notion dataframes.
+
+Compares the previous per-row list comprehension with `helpers.rendering.render_tag_buttons`.
+
+Usage: python benchmarks/bench_render.py [n_rows]
+"""
+import random
+import sys
+import timeit
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'src'))
+from helpers.rendering import render_tag_buttons
+
+KEYWORDS = [f'Keyword {idx}' for idx in range(40)]
+
+def legacy_render(keywords_column: pd.Series) -> list:
+    # Rendering used before `helpers.rendering`, on comma-joined keyword strings
+    return [
+        ''.join(['<button class="btn btn-light btn-xs" onclick="function()" style="padding: 1px; margin: 4px 2px; font-size: 12px;">{}</button>'.format(keyword) for keyword in [kw for kw in str(keywords).split(', ') if kw != 'nan']])
+        for keywords in keywords_column
+    ]
+
+def main(n_rows: int = 10_000):
+    rng = random.Random(0)
+    keyword_lists = [rng.sample(KEYWORDS, rng.randint(0, 4)) for _ in range(n_rows)]
+    joined = pd.Series([', '.join(keywords) for keywords in keyword_lists])
+    lists = pd.Series(keyword_lists)
+
+    legacy = pd.Series(legacy_render(joined))
+    rendered = pd.Series(render_tag_buttons(lists))
+    # The legacy code rendered an empty button for rows without keywords
+    tagged = lists.str.len() > 0
+    assert (legacy[tagged] == rendered[tagged].astype(object)).all()
+
+    repeats = 5
+    legacy_time = min(timeit.repeat(lambda: legacy_render(joined), number=1, repeat=repeats))
+    rendered_time = min(timeit.repeat(lambda: render_tag_buttons(lists), number=1, repeat=repeats))
+
+    print(f'{n_rows} rows')
+    print(f'legacy:      {legacy_time * 1000:8.2f} ms  {legacy.memory_usage(deep=True) / 1e6:8.2f} MB')
+    print(f'categorical: {rendered_time * 1000:8.2f} ms  {rendered.memory_usage(deep=True) / 1e6:8.2f} MB')
+    print(f'speedup:     {legacy_time / rendered_time:8.1f}x')
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,141 @@
+"""
+Local stand-in for a dataset host (Zenodo, STScI...) serving files over HTTP.
+
+Supports HEAD and single `Range` requests, artificial bandwidth limits and
+connections dropped in the middle of a response, so that the dataset
+downloaders can be tested and benchmarked offline.
+
+Usage: python benchmarks/file_stub.py DIRECTORY [--port PORT] [--no-ranges] [--bandwidth MB/S] [--drop N]
+"""
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+RANGE_HEADER = re.compile(r'^bytes=(?P<start>\d+)-(?P<end>\d*)$')
+
+
+class FileStub:
+    """
+    Serve the files of `directory` from a threaded HTTP server.
+
+    `drop` responses are cut after half of their body, `bandwidth` (bytes per
+    second) throttles each connection, and every served byte range is logged in
+    `ranges` (as `(name, start, end)`).
+    """
+    def __init__(self, directory: Path, ranges: bool = True, bandwidth: Optional[float] = None, drop: int = 0):
+        self.directory = Path(directory)
+        self.accept_ranges = ranges
+        self.bandwidth = bandwidth
+        self.drop = drop
+        self.ranges: List[Tuple[str, int, int]] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _should_drop(self) -> bool:
+        with self._lock:
+            if self.drop > 0:
+                self.drop -= 1
+                return True
+            return False
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _target(self) -> Optional[Path]:
+                path = (stub.directory / self.path.lstrip('/')).resolve()
+                if stub.directory.resolve() not in path.parents or not path.is_file():
+                    self.send_error(404)
+                    return None
+                return path
+
+            def _headers(self, status: int, length: int, extra: Optional[dict] = None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(length))
+                if stub.accept_ranges:
+                    self.send_header('Accept-Ranges', 'bytes')
+                for key, value in (extra or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+
+            def do_HEAD(self):
+                path = self._target()
+                if path is not None:
+                    self._headers(200, path.stat().st_size, {'ETag': f'"{path.stat().st_mtime_ns}"'})
+
+            def do_GET(self):
+                path = self._target()
+                if path is None:
+                    return
+                size = path.stat().st_size
+                start, end, status, extra = 0, size - 1, 200, {}
+                match = RANGE_HEADER.match(self.headers.get('Range', ''))
+                if stub.accept_ranges and match is not None:
+                    start = int(match['start'])
+                    end = min(int(match['end'] or size - 1), size - 1)
+                    status = 206
+                    extra['Content-Range'] = f'bytes {start}-{end}/{size}'
+                length = end - start + 1
+                with stub._lock:
+                    stub.ranges.append((path.name, start, end))
+
+                self._headers(status, length, extra)
+                # Cut the response after half of its body
+                if stub._should_drop():
+                    length //= 2
+                    self.close_connection = True
+                with open(path, 'rb') as file:
+                    file.seek(start)
+                    while length > 0:
+                        block = file.read(min(length, 256 * 1024))
+                        if not block:
+                            break
+                        self.wfile.write(block)
+                        length -= len(block)
+                        if stub.bandwidth:
+                            time.sleep(len(block) / stub.bandwidth)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Serve in a background thread and return the base URL of the files.
+        """
+        self._server = ThreadingHTTPServer((host, port), self.handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', type=Path, help='Directory of the files to serve.')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--no-ranges', action='store_true', help='Ignore Range requests.')
+    parser.add_argument('--bandwidth', type=float, help='Bandwidth of each connection, in MB/s.')
+    parser.add_argument('--drop', type=int, default=0, help='Number of responses to cut in the middle.')
+    args = parser.parse_args()
+
+    stub = FileStub(args.directory, not args.no_ranges, args.bandwidth and args.bandwidth * 1e6, args.drop)
+    url = stub.start(port=args.port)
+    print(f'Serving {args.directory} on {url} (Ctrl+C to stop)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
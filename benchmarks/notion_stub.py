@@ -0,0 +1,206 @@
+"""
+Local stand-in for the Notion API database query endpoint.
+
+Serves synthetic databases (or snapshots recorded by `helpers.notion_cache`),
+with pagination, `last_edited_time` filters, random 429 throttling and
+artificial latency, so that `helpers.notion_api` can be tested and benchmarked
+offline. Point the helpers to it with `NOTION_API_URL=http://<host>:<port>/v1`
+(any `NOTION_KEY` is accepted).
+
+Usage: python benchmarks/notion_stub.py [--rows N] [--latency S] [--throttle P] [--replay DIR] [--port PORT]
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+SOFTWARE_TOOLS_DATABASE_ID = "043e925d562a4d688d83fd8f6a2aad07"
+
+KEYWORDS = [
+    'Image segmentation', 'Instance segmentation', 'Image registration', 'Object tracking',
+    'Image denoising', 'Image reconstruction', 'Visualization', 'Deep learning', 'Python',
+    'Fiji', 'Napari', 'Performance', 'Open science', 'Microscopy', 'Big data',
+]
+
+QUERY_PATH = re.compile(r'^/v1/databases/(?P<database_id>[^/]+)/query$')
+
+
+def _rich_text(text: str) -> List[dict]:
+    return [{'type': 'text', 'plain_text': text, 'text': {'content': text}}]
+
+
+def _multi_select(rng: random.Random) -> dict:
+    return {'multi_select': [{'name': name} for name in rng.sample(KEYWORDS, rng.randint(0, 3))]}
+
+
+def synthetic_pages(database_id: str, n_rows: int, seed: int = 0) -> List[dict]:
+    """
+    Pages shaped like the ones of the field guide databases (software tools, or online resources for any other ID).
+    """
+    rng = random.Random(seed)
+    pages = []
+    for idx in range(n_rows):
+        properties = {
+            'Field guide': {'checkbox': rng.random() < 0.9},
+            'Favourite': {'checkbox': rng.random() < 0.1},
+            'Keywords': _multi_select(rng),
+        }
+        if database_id == SOFTWARE_TOOLS_DATABASE_ID:
+            properties.update({
+                'Software tool': {'title': _rich_text(f'Tool {idx}')},
+                'Description': {'rich_text': _rich_text(f'Description of tool {idx}.')},
+                'Homepage': {'url': f'https://example.com/tools/{idx}'},
+                'Used for': _multi_select(rng),
+            })
+        else:
+            properties.update({
+                'Name': {'title': _rich_text(f'Resource {idx}')},
+                'Link': {'url': f'https://example.com/resources/{idx}'},
+            })
+        day = 1 + idx % 28
+        pages.append({
+            'object': 'page',
+            'id': f'{database_id[:8]}-{idx:08d}',
+            'created_time': '2024-01-01T00:00:00.000Z',
+            'last_edited_time': f'2024-02-{day:02d}T00:00:00.000Z',
+            'archived': False,
+            'properties': properties,
+        })
+    return pages
+
+
+class NotionStub:
+    """
+    In-memory databases served by a threaded HTTP server.
+    """
+    def __init__(self, n_rows: int = 1000, latency: float = 0.0, throttle: float = 0.0, replay: Optional[Path] = None, seed: int = 0):
+        self.n_rows = n_rows
+        self.latency = latency
+        self.throttle = throttle
+        self.replay = replay
+        self.seed = seed
+        self.requests = 0
+        self.throttled = 0
+        self._databases: Dict[str, List[dict]] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def reset(self, n_rows: int) -> None:
+        """
+        Serve synthetic databases of `n_rows` rows from now on.
+        """
+        with self._lock:
+            self.n_rows = n_rows
+            self.requests = 0
+            self.throttled = 0
+            self._databases.clear()
+
+    def pages(self, database_id: str) -> List[dict]:
+        with self._lock:
+            if database_id not in self._databases:
+                if self.replay is not None:
+                    with open(self.replay / f'{database_id}.json', 'r', encoding='utf-8') as file:
+                        self._databases[database_id] = list(json.load(file)['pages'].values())
+                else:
+                    self._databases[database_id] = synthetic_pages(database_id, self.n_rows, self.seed)
+            return self._databases[database_id]
+
+    def query(self, database_id: str, payload: dict) -> dict:
+        pages = self.pages(database_id)
+        query_filter = payload.get('filter')
+        if query_filter is not None:
+            since = query_filter['last_edited_time']['on_or_after']
+            pages = [page for page in pages if page['last_edited_time'] >= since]
+
+        page_size = min(int(payload.get('page_size', 100)), 100)
+        start = int(payload.get('start_cursor') or 0)
+        end = start + page_size
+        has_more = end < len(pages)
+        return {
+            'object': 'list',
+            'results': pages[start:end],
+            'has_more': has_more,
+            'next_cursor': str(end) if has_more else None,
+        }
+
+    def _should_throttle(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            throttled = self._rng.random() < self.throttle
+            self.throttled += throttled
+            return throttled
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                match = QUERY_PATH.match(self.path)
+                if match is None:
+                    return self._reply(404, {'object': 'error', 'status': 404, 'code': 'object_not_found'})
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub._should_throttle():
+                    return self._reply(429, {'object': 'error', 'status': 429, 'code': 'rate_limited'}, {'Retry-After': '0.1'})
+                try:
+                    data = stub.query(match['database_id'], json.loads(body or b'{}'))
+                except FileNotFoundError:
+                    return self._reply(404, {'object': 'error', 'status': 404, 'code': 'object_not_found'})
+                self._reply(200, data)
+
+            def _reply(self, status: int, data: dict, headers: Optional[dict] = None):
+                content = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """
+        Serve in a background thread and return the base URL to use as `NOTION_API_URL`.
+        """
+        self._server = ThreadingHTTPServer((host, port), self.handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000, help='Rows of each synthetic database.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay added to every response, in seconds.')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Fraction of requests answered with a 429.')
+    parser.add_argument('--replay', type=Path, help='Directory of snapshots written by helpers.notion_cache.')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = NotionStub(args.rows, args.latency, args.throttle, args.replay)
+    url = stub.start(port=args.port)
+    print(f'Serving a Notion stand-in on {url} (Ctrl+C to stop)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
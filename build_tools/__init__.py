@@ -0,0 +1,12 @@
+"""
+Tools used to build the Jupyter book.
+"""
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+SRC_DIR = REPO_DIR / 'src'
+
+# Make `helpers` importable from the build tools
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
@@ -0,0 +1,392 @@
+"""
+Build the Jupyter book, executing its notebooks in parallel first.
+
+The `.ipynb` notebooks of the book are executed in a bounded pool of kernels
+(sized to the available cores and memory) and written back in place with their
+outputs. Each notebook runs in its own worker process, so that a kernel that
+fails or times out does not affect the others. The execution settings of
+`_config.yml` (mode, excluded patterns, cell timeout) are honoured.
+
+The key and content hash of the written notebooks are recorded in
+`_build/executed_notebooks.json`. In `auto` mode, a notebook is executed again
+when its code, environment or datasets changed since it was recorded, and a
+notebook never executed by this module when one of its code cells has no
+outputs, like Jupyter Book does. Registered in `src/_config.yml`
+(`sphinx.local_extensions`), this module then keeps Jupyter Book from executing
+the recorded notebooks that did not change since they were written.
+
+Notebooks whose code, environment and datasets did not change since they were
+last executed get their outputs from the execution cache instead, and only the
+changed cells of the other notebooks are executed again (see
+`build_tools/execution_cache.py`).
+
+The wall time, CPU time and peak memory of every executed cell are written to
+a profile of the build (see `build_tools/build_profile.py`).
+
+The MyST pages (section indexes) are still executed by Jupyter Book.
+
+Usage: python -m build_tools.build_book [book directory] [--jobs N] [--timeout S]
+                                        [--cell-timeout S] [--force] [--no-cache] [--no-build]
+"""
+import argparse
+import asyncio
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import nbformat
+import yaml
+from nbclient import NotebookClient
+from nbclient.exceptions import CellExecutionError
+from nbclient.util import ensure_async
+
+from build_tools import SRC_DIR, build_profile, execution_cache
+from helpers.timing import stage
+
+# Memory to reserve for each kernel, in bytes
+KERNEL_MEMORY = int(float(os.environ.get('FIELD_GUIDE_KERNEL_MEMORY', 2 * 1024 ** 3)))
+
+# Maximum time to execute one notebook, in seconds
+NOTEBOOK_TIMEOUT = 1800
+
+# Jupyter Book's default timeout of a cell, in seconds
+CELL_TIMEOUT = 30
+
+EXECUTED_FILE = Path('_build') / 'executed_notebooks.json'
+
+
+def available_memory() -> Optional[int]:
+    try:
+        with open('/proc/meminfo', 'r') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_jobs() -> int:
+    jobs = os.cpu_count() or 1
+    memory = available_memory()
+    if memory is not None:
+        jobs = min(jobs, memory // KERNEL_MEMORY)
+    return max(1, jobs)
+
+
+def load_execute_config(book_dir: Path) -> dict:
+    with open(book_dir / '_config.yml', 'r', encoding='utf-8') as file:
+        return (yaml.safe_load(file) or {}).get('execute') or {}
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def load_executed(book_dir: Path) -> dict:
+    """
+    Key and content hash of the notebooks written by the previous executions, by location in the book.
+    """
+    try:
+        with open(book_dir / EXECUTED_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_executed(book_dir: Path, executed: dict) -> None:
+    path = book_dir / EXECUTED_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix('.tmp'), 'w', encoding='utf-8') as file:
+        json.dump(executed, file, indent=1, sort_keys=True)
+    os.replace(path.with_suffix('.tmp'), path)
+
+
+def missing_outputs(nb) -> bool:
+    # Like myst-nb in `auto` mode: code cells without outputs, such as the imports, count too
+    return any(not cell.get('outputs') for cell in nb.cells if cell.cell_type == 'code')
+
+
+def is_outdated(path: Path, book_dir: Path, executed: dict) -> bool:
+    """
+    Whether a notebook must be executed in `auto` mode.
+    """
+    nb = nbformat.read(path, as_version=4)
+    location = path.relative_to(book_dir).as_posix()
+    record = executed.get(location)
+    if record is None:
+        return missing_outputs(nb)
+    key = execution_cache.notebook_key(nb, location, path.parent)
+    return record['key'] != key or record['sha256'] != content_hash(path.read_bytes())
+
+
+def write_executed(nb, path: Path, key: str) -> dict:
+    """
+    Write an executed notebook in place. Returns its record for `_build/executed_notebooks.json`.
+    """
+    nbformat.write(nb, path)
+    return {'key': key, 'sha256': content_hash(path.read_bytes())}
+
+
+def find_notebooks(book_dir: Path, exclude_patterns: List[str]) -> List[Path]:
+    notebooks = []
+    for path in sorted(book_dir.rglob('*.ipynb')):
+        relative = path.relative_to(book_dir).as_posix()
+        if relative.startswith('_build/') or '.ipynb_checkpoints' in path.parts:
+            continue
+        if any(fnmatch.fnmatch(relative, pattern) for pattern in exclude_patterns):
+            continue
+        notebooks.append(path)
+    return notebooks
+
+
+async def run_silently(client: NotebookClient, source: str, user_expressions: Optional[dict] = None) -> Optional[dict]:
+    """
+    Run code in the kernel of `client`, outside of the notebook. Returns the reply if it succeeded.
+    """
+    msg_id = await ensure_async(client.kc.execute(
+        source, silent=True, store_history=False, user_expressions=user_expressions
+    ))
+    reply = await client.async_wait_for_reply(msg_id)
+    return reply if reply is not None and reply['content']['status'] == 'ok' else None
+
+
+async def kernel_resources(client: NotebookClient, reset: bool = False) -> tuple:
+    reply = await run_silently(client, '', {'resources': build_profile.resources_expression(reset)})
+    return build_profile.parse_resources(reply) or (None, None)
+
+
+async def profile_cell(client: NotebookClient, cell, index: int, profile: List[dict]) -> None:
+    """
+    Execute a cell, appending its wall time and the CPU time and peak RSS of the kernel to `profile`.
+    """
+    cpu_before, _ = await kernel_resources(client, reset=True)
+    start = time.perf_counter()
+    error = None
+    try:
+        await client.async_execute_cell(cell, index, execution_count=client.code_cells_executed + 1)
+    except CellExecutionError as cell_error:
+        error = cell_error
+    seconds = time.perf_counter() - start
+    cpu_after, peak_rss = await kernel_resources(client)
+    profile.append({
+        'cell': index, 'status': 'error' if error else 'executed', 'title': build_profile.cell_title(cell),
+        'seconds': seconds, 'peak_rss': peak_rss,
+        'cpu_seconds': cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None,
+    })
+    if error is not None:
+        raise error
+
+
+async def execute_cells(client: NotebookClient, nb, profile: List[dict], graph: Optional[List[dict]] = None) -> int:
+    """
+    Execute the code cells whose outputs are not cached (and those they depend on), reusing
+    the cached outputs of the others. Without `graph`, execute all of them and cache nothing.
+    The profile of the cells is appended to `profile`. Returns the number of executed cells.
+    """
+    cells = [(index, cell) for index, cell in enumerate(nb.cells) if cell.cell_type == 'code']
+    if graph is None:
+        execute, restore = set(range(len(cells))), set()
+    else:
+        execute, restore = execution_cache.plan_execution(graph)
+
+    if execute:
+        client.reset_execution_trackers()
+        async with client.async_setup_kernel():
+            # Like `NotebookClient.async_execute`
+            info = await client.async_wait_for_reply(await ensure_async(client.kc.kernel_info()))
+            if info is not None and 'language_info' in info['content']:
+                nb.metadata['language_info'] = info['content']['language_info']
+            await run_silently(client, build_profile.KERNEL_RESOURCES_SOURCE)
+            for position, (index, cell) in enumerate(cells):
+                key = graph[position]['key'] if graph is not None else None
+                if position in restore and not await run_silently(client, execution_cache.restore_state_source(key)):
+                    execution_cache.state_path(key).unlink(missing_ok=True)
+                    raise RuntimeError(f'Could not restore the variables exported by code cell {position}.')
+                if position not in execute:
+                    continue
+                await profile_cell(client, cell, index, profile)
+                if key is not None:
+                    execution_cache.store_cell_outputs(cell, key)
+                    if graph[position]['exports']:
+                        # Variables that cannot be pickled are simply not cached
+                        await run_silently(client, execution_cache.save_state_source(graph[position]['exports'], key))
+            client.set_widgets_metadata()
+
+    for count, (index, cell) in enumerate(cells, 1):
+        if count - 1 not in execute:
+            cell.outputs = execution_cache.load_cell_outputs(graph[count - 1]['key']) or []
+            profile.append({
+                'cell': index, 'status': 'cached', 'title': build_profile.cell_title(cell),
+                'seconds': None, 'cpu_seconds': None, 'peak_rss': None,
+            })
+        # Number the cells as if they were all executed in order
+        cell.execution_count = count
+    profile.sort(key=lambda entry: entry['cell'])
+    return len(execute)
+
+
+def execute_notebook(path: Path, book_dir: Path, timeout: float, cell_timeout: float, cache: bool = True) -> dict:
+    """
+    Execute a notebook in its directory and write it back in place (and to the cache) if it succeeds.
+    """
+    nb = nbformat.read(path, as_version=4)
+    location = path.relative_to(book_dir).as_posix()
+    client = NotebookClient(nb, timeout=cell_timeout, resources={'metadata': {'path': str(path.parent)}})
+    # Kept when the execution fails or times out
+    profile = []
+    n_cells = sum(cell.cell_type == 'code' for cell in nb.cells)
+    executed = n_cells
+    start = time.perf_counter()
+    record = None
+    with stage('notebook_execute', notebook=str(path)) as timing:
+        try:
+            key = execution_cache.notebook_key(nb, location, path.parent)
+            graph = execution_cache.cell_graph(nb, location, path.parent) if cache else None
+            executed = asyncio.run(asyncio.wait_for(execute_cells(client, nb, profile, graph), timeout))
+        except asyncio.TimeoutError:
+            status = 'timeout'
+        except CellExecutionError as error:
+            status = 'error'
+            print(f"Error in '{path}':\n{error}")
+        except Exception as error:
+            status = 'error'
+            print(f"Could not execute '{path}': {error!r}")
+        else:
+            status = 'ok'
+            record = write_executed(nb, path, key)
+            if cache:
+                execution_cache.store(nb, key)
+        timing['status'] = status
+        timing['cells'] = executed
+
+    return {
+        'path': path, 'status': status, 'seconds': time.perf_counter() - start,
+        'cells': (executed, n_cells), 'profile': profile, 'record': record,
+    }
+
+
+def restore_cached(book_dir: Path, paths: List[Path], executed: dict) -> List[Path]:
+    """
+    Write the cached outputs of the notebooks in place, recording them in `executed`.
+    Returns the notebooks that were not cached.
+    """
+    missing = []
+    for path in paths:
+        nb = nbformat.read(path, as_version=4)
+        location = path.relative_to(book_dir).as_posix()
+        key = execution_cache.notebook_key(nb, location, path.parent)
+        if execution_cache.load_outputs(nb, key):
+            executed[location] = write_executed(nb, path, key)
+            print(f"{'cached':>7}  {'':9}  {path}")
+        else:
+            missing.append(path)
+    return missing
+
+
+def execute_notebooks(paths: List[Path], book_dir: Path, jobs: int, timeout: float, cell_timeout: float, cache: bool = True) -> List[dict]:
+    """
+    Execute notebooks in a pool of `jobs` processes, each running one kernel at a time.
+    """
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(execute_notebook, path, book_dir, timeout, cell_timeout, cache) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            executed, n_cells = result['cells']
+            print(f"{result['status']:>7}  {result['seconds']:7.1f} s  {result['path']} ({executed}/{n_cells} cells executed)")
+            results.append(result)
+    return results
+
+
+def build_book(
+    book_dir: Path = SRC_DIR,
+    jobs: Optional[int] = None,
+    timeout: float = NOTEBOOK_TIMEOUT,
+    cell_timeout: Optional[float] = None,
+    force: bool = False,
+    cache: bool = True,
+    build: bool = True,
+    notebooks: Optional[Iterable[Path]] = None,
+) -> int:
+    """
+    Execute the notebooks of the book (or only those of `notebooks`), then build it.
+    Returns the exit code of `jupyter-book build`.
+    """
+    config = load_execute_config(book_dir)
+    mode = config.get('execute_notebooks', 'auto')
+    cell_timeout = cell_timeout if cell_timeout is not None else config.get('timeout', CELL_TIMEOUT)
+    jobs = jobs or default_jobs()
+
+    if mode != 'off' or force:
+        selected = None if notebooks is None else {path.resolve() for path in notebooks}
+        notebooks = [
+            path for path in find_notebooks(book_dir, config.get('exclude_patterns') or [])
+            if selected is None or path.resolve() in selected
+        ]
+        executed = load_executed(book_dir)
+        if not force and mode != 'force':
+            notebooks = [path for path in notebooks if is_outdated(path, book_dir, executed)]
+
+        start = time.perf_counter()
+        pending = restore_cached(book_dir, notebooks, executed) if cache else notebooks
+        print(f'Executing {len(pending)} notebooks ({len(notebooks) - len(pending)} cached) with {jobs} kernels...')
+        results = execute_notebooks(pending, book_dir, jobs, timeout, cell_timeout, cache)
+        for result in results:
+            location = result['path'].relative_to(book_dir).as_posix()
+            if result['record'] is not None:
+                executed[location] = result['record']
+            else:
+                executed.pop(location, None)
+        save_executed(book_dir, executed)
+        failed = [result for result in results if result['status'] != 'ok']
+        print(f'Executed {len(results) - len(failed)} notebooks in {time.perf_counter() - start:.1f} s '
+              f'({sum(result["seconds"] for result in results):.1f} s of kernel time), {len(failed)} failed.')
+        cached = [path for path in notebooks if path not in pending]
+        print(f"Profile written to '{build_profile.write_profile(book_dir, results, cached)}'.")
+
+    if not build:
+        return 0
+    return subprocess.run(['jupyter-book', 'build', str(book_dir)]).returncode
+
+
+def source_read(app, docname: str, source: List[str]) -> None:
+    """
+    Turn off the execution by myst-nb of the notebooks that did not change since `build_book` wrote them.
+    Only the source given to Sphinx is changed, not the notebook file.
+    """
+    location = Path(app.env.doc2path(docname, False)).as_posix()
+    record = load_executed(Path(app.srcdir)).get(location)
+    if not location.endswith('.ipynb') or record is None or record['sha256'] != content_hash(source[0].encode('utf-8')):
+        return
+    nb = nbformat.reads(source[0], as_version=4)
+    nb.metadata.setdefault('mystnb', {})['execution_mode'] = 'off'
+    source[0] = nbformat.writes(nb)
+
+
+def setup(app):
+    app.connect('source-read', source_read)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('book_dir', nargs='?', type=Path, default=SRC_DIR, help='Directory of the book (default: src/).')
+    parser.add_argument('--jobs', type=int, help='Number of kernels running in parallel (default: from the cores and memory).')
+    parser.add_argument('--timeout', type=float, default=NOTEBOOK_TIMEOUT, help='Maximum time to execute a notebook, in seconds.')
+    parser.add_argument('--cell-timeout', type=float, help='Maximum time to execute a cell, in seconds (default: from _config.yml).')
+    parser.add_argument('--force', action='store_true', help='Execute the notebooks that are up to date too.')
+    parser.add_argument('--no-cache', action='store_true', help='Execute all the cells, even if their outputs are cached.')
+    parser.add_argument('--no-build', action='store_true', help='Only execute the notebooks.')
+    args = parser.parse_args()
+
+    sys.exit(build_book(
+        args.book_dir, args.jobs, args.timeout, args.cell_timeout, args.force, not args.no_cache, not args.no_build
+    ))
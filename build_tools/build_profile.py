@@ -0,0 +1,194 @@
+"""
+Profile of the notebook executions of a book build.
+
+`build_tools.build_book` records the wall time, CPU time and peak RSS of the
+kernel for every cell it executes (the peak is reset before each cell where
+Linux allows it, otherwise it is the peak of the kernel so far), and merges them
+into `_build/build_profile.json` in the book directory: the notebooks that an
+(incremental) build did not execute keep the profile of their last execution.
+
+Registered in `src/_config.yml` (`sphinx.local_extensions`), this module then
+adds the runtime of the MyST pages executed by Jupyter Book (myst-nb only
+records it per page) and writes the whole report to the built site, as
+`build-profile.json` and a `build-profile.html` summary page.
+"""
+import ast
+import html
+import json
+import time
+from pathlib import Path
+from typing import List, Optional
+
+PROFILE_FILE = Path('_build') / 'build_profile.json'
+
+REPORT_NAME = 'build-profile'
+
+# Cells listed in the summary of the slowest and most memory hungry cells
+TOP_CELLS = 20
+
+# Defined silently in each kernel; returns its CPU time and peak RSS, optionally resetting the peak
+KERNEL_RESOURCES_SOURCE = '''\
+def _field_guide_resources(reset=False):
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    peak = usage.ru_maxrss * 1024
+    try:
+        with open('/proc/self/status') as file:
+            peak = next(int(line.split()[1]) * 1024 for line in file if line.startswith('VmHWM:'))
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as file:
+                file.write('5')
+    except (OSError, StopIteration):
+        pass
+    return usage.ru_utime + usage.ru_stime, peak
+'''
+
+
+def resources_expression(reset: bool = False) -> str:
+    return f'_field_guide_resources(reset={reset})'
+
+
+def parse_resources(reply: Optional[dict]) -> Optional[tuple]:
+    """
+    `(CPU seconds, peak RSS in bytes)` from the reply of an `execute` request evaluating `resources_expression()`.
+    """
+    try:
+        value = reply['content']['user_expressions']['resources']
+        return ast.literal_eval(value['data']['text/plain'])
+    except (KeyError, TypeError, ValueError, SyntaxError):
+        return None
+
+
+def cell_title(cell) -> str:
+    lines = [line for line in cell.source.splitlines() if line.strip()]
+    return lines[0][:80] if lines else ''
+
+
+def load_profile(path: Path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'created': time.time(), 'notebooks': []}
+
+
+def write_profile(book_dir: Path, results: List[dict], cached: List[Path]) -> Path:
+    """
+    Merge the profile of the executed (and cached) notebooks of `build_tools.build_book` into the
+    previous one, by notebook path. A cached notebook keeps the profile of its last execution.
+    """
+    path = book_dir / PROFILE_FILE
+    previous = {
+        notebook['path']: notebook for notebook in load_profile(path)['notebooks']
+        # Forget the notebooks that were removed
+        if (book_dir / notebook['path']).exists()
+    }
+
+    notebooks = [{
+        'path': result['path'].relative_to(book_dir).as_posix(),
+        'status': result['status'],
+        'seconds': result['seconds'],
+        'cpu_seconds': sum(cell['cpu_seconds'] or 0 for cell in result['profile']),
+        'peak_rss': max((cell['peak_rss'] or 0 for cell in result['profile']), default=0),
+        'cells': result['profile'],
+    } for result in results]
+    notebooks += [{
+        'path': cached_path.relative_to(book_dir).as_posix(), 'status': 'cached',
+        'seconds': 0.0, 'cpu_seconds': 0.0, 'peak_rss': 0, 'cells': [],
+    } for cached_path in cached if cached_path.relative_to(book_dir).as_posix() not in previous]
+    previous.update((notebook['path'], notebook) for notebook in notebooks)
+    notebooks = sorted(previous.values(), key=lambda notebook: notebook['path'])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'created': time.time(), 'notebooks': notebooks}, file, indent=1)
+    return path
+
+
+def format_bytes(size: Optional[int]) -> str:
+    return '' if not size else f'{size / 1024 ** 2:,.0f} MiB'
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    return '' if seconds is None else f'{seconds:,.1f} s'
+
+
+def render_table(headers: List[str], rows: List[list]) -> str:
+    head = ''.join(f'<th>{html.escape(header)}</th>' for header in headers)
+    body = ''.join('<tr>' + ''.join(f'<td>{html.escape(str(value))}</td>' for value in row) + '</tr>' for row in rows)
+    return f'<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>'
+
+
+def render_html(report: dict) -> str:
+    notebooks = sorted(report['notebooks'], key=lambda notebook: -(notebook['seconds'] or 0))
+    cells = [
+        {**cell, 'path': notebook['path']}
+        for notebook in report['notebooks'] for cell in notebook['cells'] if cell['status'] != 'cached'
+    ]
+
+    sections = [
+        '<h2>Notebooks</h2>',
+        render_table(
+            ['Notebook', 'Status', 'Wall time', 'CPU time', 'Peak RSS', 'Executed cells'],
+            [[
+                notebook['path'], notebook['status'], format_seconds(notebook['seconds']),
+                format_seconds(notebook.get('cpu_seconds')), format_bytes(notebook.get('peak_rss')),
+                f"{sum(cell['status'] != 'cached' for cell in notebook['cells'])}/{len(notebook['cells'])}"
+                if notebook['cells'] else '',
+            ] for notebook in notebooks],
+        ),
+    ]
+    for title, key in (('Slowest cells', 'seconds'), ('Most memory hungry cells', 'peak_rss')):
+        top = sorted(cells, key=lambda cell: -(cell[key] or 0))[:TOP_CELLS]
+        sections += [f'<h2>{title}</h2>', render_table(
+            ['Notebook', 'Cell', 'Wall time', 'CPU time', 'Peak RSS', 'Code'],
+            [[
+                cell['path'], cell['cell'], format_seconds(cell['seconds']), format_seconds(cell['cpu_seconds']),
+                format_bytes(cell['peak_rss']), cell['title'],
+            ] for cell in top],
+        )]
+
+    total = sum(notebook['seconds'] or 0 for notebook in report['notebooks'])
+    return (
+        '<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8"><title>Build profile</title>'
+        '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}'
+        'td,th{border:1px solid #ccc;padding:.25em .5em;text-align:left}</style></head><body>'
+        f'<h1>Build profile</h1><p>{len(notebooks)} notebooks, {format_seconds(total)} of execution. '
+        f'Machine-readable report: <a href="{REPORT_NAME}.json">{REPORT_NAME}.json</a>.</p>'
+        + ''.join(sections) + '</body></html>\n'
+    )
+
+
+def myst_pages(env) -> List[dict]:
+    """
+    Pages executed by Jupyter Book, with their runtime recorded by myst-nb.
+    """
+    pages = []
+    for docname, data in sorted(getattr(env, 'nb_metadata', {}).items()):
+        exec_data = data.get('exec_data')
+        if exec_data:
+            pages.append({
+                'path': env.doc2path(docname, False),
+                'status': ('ok' if exec_data['succeeded'] else 'error') if exec_data['method'] != 'cache' else 'cached',
+                'seconds': exec_data['runtime'],
+                'cells': [],
+            })
+    return pages
+
+
+def build_finished(app, exception) -> None:
+    if exception is not None or app.builder.format != 'html':
+        return
+
+    report = load_profile(Path(app.srcdir) / PROFILE_FILE)
+    report['notebooks'] += myst_pages(app.env)
+
+    out_dir = Path(app.outdir)
+    with open(out_dir / f'{REPORT_NAME}.json', 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=1)
+    (out_dir / f'{REPORT_NAME}.html').write_text(render_html(report), encoding='utf-8')
+
+
+def setup(app):
+    app.connect('build-finished', build_finished)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
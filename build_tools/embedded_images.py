@@ -0,0 +1,166 @@
+"""
+Sphinx extension moving the images embedded in the pages to their own files.
+
+Notebook outputs rendered as HTML (napari screenshots, some plots and widgets)
+embed their images as base64 `data:` URIs, which makes the pages megabytes
+larger and the images impossible to cache. Once the HTML pages are written, the
+large embedded PNG and JPEG images are decoded, recompressed to lossy WebP
+(unless that is larger) and written to `_images/embedded/`, named after a hash
+of their content so that an image shared by several pages is downloaded once.
+Their `<img>` tags then point to these files and are loaded lazily.
+
+Registered in `src/_config.yml` (`sphinx.local_extensions`).
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Set, Tuple
+
+from PIL import Image, features
+from sphinx.util import logging
+
+from build_tools import REPO_DIR
+
+# Make `convert_images` importable
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+from convert_images import SAVE_OPTIONS
+
+logger = logging.getLogger(__name__)
+
+EMBEDDED_DIR = 'embedded'
+
+# Smaller images (icons) are cheaper to keep inline than to download
+MIN_EMBEDDED_SIZE = 4096
+
+IMG_TAG = re.compile(r'<img\b[^>]*>')
+DATA_URI = re.compile(r'\ssrc=(?P<quote>["\'])data:image/(?:png|jpeg|jpg);base64,(?P<data>[A-Za-z0-9+/=\s]+)(?P=quote)')
+EXTRACTED_REFERENCE = re.compile(rf'_images/{EMBEDDED_DIR}/(?P<name>[0-9a-f]+\.(?:webp|png|jpeg))')
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def write_image(data: bytes, out_dir: str) -> Tuple[str, Tuple[int, int]]:
+    """
+    Write an embedded image as lossy WebP (or as is, if smaller) to `out_dir`. Returns its file name and size.
+    """
+    stem = digest(data)
+    with Image.open(io.BytesIO(data)) as img:
+        size = img.size
+        original = 'png' if img.format == 'PNG' else 'jpeg'
+        for fmt in ('webp', original):
+            path = os.path.join(out_dir, f'{stem}.{fmt}')
+            if os.path.exists(path):
+                return os.path.basename(path), size
+
+        encoded = None
+        if features.check('webp'):
+            # Palette and 16-bit images cannot be saved as WebP as such
+            mode = img.mode if img.mode in ('RGB', 'RGBA', 'L') else 'RGBA'
+            buffer = io.BytesIO()
+            img.convert(mode).save(buffer, format='WEBP', **SAVE_OPTIONS['webp'])
+            encoded = buffer.getvalue()
+    if encoded is None or len(encoded) >= len(data):
+        fmt, encoded = original, data
+    else:
+        fmt = 'webp'
+
+    path = os.path.join(out_dir, f'{stem}.{fmt}')
+    with open(path + '.tmp', 'wb') as file:
+        file.write(encoded)
+    os.replace(path + '.tmp', path)
+    return os.path.basename(path), size
+
+
+def find_embedded(pages) -> Tuple[Dict[str, bytes], Set[str]]:
+    """
+    Large embedded images of the pages, by hash of their content, and the names of the images already
+    extracted from the pages that were not written again since a previous build.
+    """
+    images, extracted = {}, set()
+    for page in pages:
+        html = page.read_text(encoding='utf-8')
+        extracted.update(EXTRACTED_REFERENCE.findall(html))
+        for tag in IMG_TAG.findall(html):
+            match = DATA_URI.search(tag)
+            if match is None or len(match['data']) < MIN_EMBEDDED_SIZE:
+                continue
+            try:
+                data = base64.b64decode(match['data'])
+            except (binascii.Error, ValueError):
+                continue
+            images.setdefault(digest(data), data)
+    return images, extracted
+
+
+def rewrite_page(path: Path, site_dir: Path, written: Dict[str, tuple]) -> bool:
+    html = path.read_text(encoding='utf-8')
+    prefix = '../' * (len(path.relative_to(site_dir).parts) - 1)
+
+    def replace(match: re.Match) -> str:
+        tag = match[0]
+        data_uri = DATA_URI.search(tag)
+        if data_uri is None or len(data_uri['data']) < MIN_EMBEDDED_SIZE:
+            return tag
+        try:
+            name, (width, height) = written[digest(base64.b64decode(data_uri['data']))]
+        except (binascii.Error, ValueError, KeyError):
+            return tag
+        attributes = f' src="{prefix}_images/{EMBEDDED_DIR}/{name}"'
+        if 'width=' not in tag and 'height=' not in tag:
+            # Reserve the space of the image before it is loaded
+            attributes += f' width="{width}" height="{height}"'
+        if 'loading=' not in tag:
+            attributes += ' loading="lazy" decoding="async"'
+        return tag[:data_uri.start()] + attributes + tag[data_uri.end():]
+
+    rewritten = IMG_TAG.sub(replace, html)
+    if rewritten == html:
+        return False
+    path.write_text(rewritten, encoding='utf-8')
+    return True
+
+
+def build_finished(app, exception) -> None:
+    if exception is not None or app.builder.format != 'html':
+        return
+
+    site_dir = Path(app.outdir)
+    pages = sorted(site_dir.rglob('*.html'))
+    images, extracted = find_embedded(pages)
+    out_dir = site_dir / '_images' / EMBEDDED_DIR
+    if not images and not out_dir.exists():
+        return
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = {}
+    with ProcessPoolExecutor(max_workers=app.parallel if app.parallel > 1 else None) as executor:
+        futures = {key: executor.submit(write_image, data, str(out_dir)) for key, data in images.items()}
+        for key, future in futures.items():
+            try:
+                written[key] = future.result()
+            except OSError as error:
+                logger.warning(f'Could not extract an embedded image: {error}')
+
+    # Keep the images of the pages rewritten by a previous build (and not written again by this one)
+    used = extracted | {name for name, _ in written.values()}
+    for path in out_dir.iterdir():
+        if path.name not in used:
+            path.unlink()
+
+    updated = sum(rewrite_page(path, site_dir, written) for path in pages)
+    embedded_bytes = sum(len(data) for data in images.values())
+    logger.info(f'embedded images: {len(written)} images ({embedded_bytes / 1e6:.1f} MB) extracted from {updated} pages')
+
+
+def setup(app):
+    app.connect('build-finished', build_finished)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
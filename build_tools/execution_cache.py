@@ -0,0 +1,248 @@
+"""
+Content-addressed cache of the executed notebooks of the book.
+
+A notebook is keyed on the hash of its path, its code cells, the kernel
+environment (Python version and installed packages), the local code it can
+import (`src/helpers/` and the `.py` files of its directory, such as
+`shared_data.py`) and the registry hashes of the datasets it reads through
+`DATASET`. Editing the text of a notebook does not
+change its key: its outputs are taken from the cache instead of executing it.
+
+When a notebook changed, its cells are cached too, each keyed on its source and
+the keys of the cells it depends on. By default a cell depends on all the cells
+before it; the `field_guide` metadata of a cell can instead name its
+dependencies, and the variables it exports for the cells depending on it:
+
+    {"field_guide": {"name": "model", "depends": ["imports", "image"], "exports": ["model"]}}
+
+Only the cells whose key changed are executed, with the cells they depend on.
+The exported variables of an unchanged dependency are restored from the cache
+(with pickle) instead of executing it again. Only these variables are restored,
+not the modules imported by the cell: a cell using these modules must also
+depend on the cell importing them, which is executed instead.
+"""
+import hashlib
+import json
+import os
+import platform
+import re
+import sys
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+import nbformat
+
+from build_tools import SRC_DIR
+from helpers.datasets import DATASET
+
+# Directory of the cached notebooks, keep it across builds (e.g. with a Docker cache mount)
+EXECUTION_CACHE_DIR = Path(os.environ.get(
+    'FIELD_GUIDE_EXECUTION_CACHE',
+    Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'field-guide' / 'execution'
+))
+
+HELPERS_DIR = SRC_DIR / 'helpers'
+
+# Key of the cell metadata declaring its name, dependencies and exported variables
+CELL_METADATA = 'field_guide'
+
+# Calls such as `DATASET.fetch("grains.tif")`, `DATASET.load(...)` or `DATASET.fetch_zarr(...)`
+DATASET_CALL = re.compile(r'DATASET\.\w+\(\s*[\'"]([^\'"]+)[\'"]')
+
+
+@lru_cache(maxsize=None)
+def environment_fingerprint() -> str:
+    """
+    Hash of the Python version and installed packages. The kernels run in the environment of the build.
+    """
+    packages = sorted(f"{dist.metadata['Name']}=={dist.version}" for dist in metadata.distributions())
+    return hashlib.sha256(json.dumps([sys.version, platform.machine(), packages]).encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def local_code_fingerprint(directory: Path) -> str:
+    """
+    Hash of the local modules a notebook of `directory` can import: `helpers` and the `.py` files next to it.
+    """
+    files = [
+        (f'helpers/{path.relative_to(HELPERS_DIR).as_posix()}', path) for path in sorted(HELPERS_DIR.rglob('*.py'))
+    ]
+    files += [(path.name, path) for path in sorted(directory.glob('*.py'))]
+    sha = hashlib.sha256()
+    for name, path in files:
+        sha.update(name.encode())
+        sha.update(hashlib.sha256(path.read_bytes()).digest())
+    return sha.hexdigest()
+
+
+def dataset_hashes(sources: List[str]) -> List[str]:
+    """
+    Registry hashes (or URLs, for the files without a hash) of the datasets read by the code.
+    """
+    names = sorted({name for source in sources for name in DATASET_CALL.findall(source)})
+    return [
+        f'{name}:{DATASET.registry[name] or DATASET.get_url(name)}' if name in DATASET.registry else name
+        for name in names
+    ]
+
+
+def notebook_key(nb, location: str, directory: Path) -> str:
+    """
+    Key of a notebook of `directory`. Its `location` (path in the book) is part of it,
+    as outputs may depend on the working directory.
+    """
+    sources = [cell.source for cell in nb.cells if cell.cell_type == 'code']
+    kernel = nb.metadata.get('kernelspec', {}).get('name')
+    content = json.dumps([
+        location, sources, kernel, environment_fingerprint(), local_code_fingerprint(directory),
+        dataset_hashes(sources),
+    ])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def cache_path(key: str) -> Path:
+    return EXECUTION_CACHE_DIR / key[:2] / f'{key}.ipynb'
+
+
+def load_outputs(nb, key: str) -> bool:
+    """
+    Copy the cached outputs of the code cells into `nb`. Returns whether they were found.
+    """
+    try:
+        cached = nbformat.read(cache_path(key), as_version=4)
+    except (OSError, ValueError):
+        return False
+
+    cached_cells = [cell for cell in cached.cells if cell.cell_type == 'code']
+    cells = [cell for cell in nb.cells if cell.cell_type == 'code']
+    if len(cached_cells) != len(cells):
+        return False
+    for cell, cached_cell in zip(cells, cached_cells):
+        cell.outputs = cached_cell.outputs
+        cell.execution_count = cached_cell.execution_count
+    return True
+
+
+def store(nb, key: str) -> None:
+    path = cache_path(key)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        nbformat.write(nb, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as error:
+        print(f"Could not cache the outputs in '{path}': {error}")
+
+
+def cell_graph(nb, location: str, directory: Path) -> List[dict]:
+    """
+    Key, dependencies (positions among the code cells) and exported variables of each code cell.
+    """
+    kernel = nb.metadata.get('kernelspec', {}).get('name')
+    names: Dict[str, int] = {}
+    graph: List[dict] = []
+    for position, cell in enumerate(cell for cell in nb.cells if cell.cell_type == 'code'):
+        declared = cell.metadata.get(CELL_METADATA, {})
+        if 'depends' in declared:
+            unknown = [name for name in declared['depends'] if name not in names]
+            if unknown:
+                raise ValueError(f"Code cell {position} of '{location}' depends on unknown cells: {unknown}")
+            depends = [names[name] for name in declared['depends']]
+        else:
+            depends = list(range(position))
+        content = json.dumps([
+            location, kernel, environment_fingerprint(), local_code_fingerprint(directory),
+            cell.source, dataset_hashes([cell.source]),
+            [graph[dependency]['key'] for dependency in depends],
+        ])
+        graph.append({
+            'key': hashlib.sha256(content.encode()).hexdigest(),
+            'depends': depends,
+            'exports': declared.get('exports', []),
+        })
+        names[declared.get('name', cell.get('id', str(position)))] = position
+    return graph
+
+
+def cell_outputs_path(key: str) -> Path:
+    return EXECUTION_CACHE_DIR / 'cells' / key[:2] / f'{key}.json'
+
+
+def state_path(key: str) -> Path:
+    return EXECUTION_CACHE_DIR / 'state' / key[:2] / f'{key}.pickle'
+
+
+def load_cell_outputs(key: str):
+    try:
+        with open(cell_outputs_path(key), 'r', encoding='utf-8') as file:
+            return [nbformat.from_dict(output) for output in json.load(file)]
+    except (OSError, ValueError):
+        return None
+
+
+def store_cell_outputs(cell, key: str) -> None:
+    path = cell_outputs_path(key)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(cell.outputs, file)
+        os.replace(tmp_path, path)
+    except OSError as error:
+        print(f"Could not cache the outputs in '{path}': {error}")
+
+
+def plan_execution(graph: List[dict]) -> Tuple[Set[int], Set[int]]:
+    """
+    Positions of the code cells to execute, and of the cells whose exported variables to restore instead.
+    """
+    execute: Set[int] = set()
+    restore: Set[int] = set()
+
+    def require_state(position: int) -> None:
+        if position in execute or position in restore:
+            return
+        if graph[position]['exports'] and state_path(graph[position]['key']).exists():
+            restore.add(position)
+        else:
+            require_execution(position)
+
+    def require_execution(position: int) -> None:
+        if position in execute:
+            return
+        restore.discard(position)
+        execute.add(position)
+        for dependency in graph[position]['depends']:
+            require_state(dependency)
+
+    for position, cell in enumerate(graph):
+        if not cell_outputs_path(cell['key']).exists():
+            require_execution(position)
+    return execute, restore
+
+
+def save_state_source(names: List[str], key: str) -> str:
+    """
+    Code pickling the exported variables of a cell from the kernel.
+    """
+    path = state_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    return (
+        "import os as _os, pickle as _pickle\n"
+        f"with open({str(tmp_path)!r}, 'wb') as _file:\n"
+        f"    _pickle.dump({{_name: globals()[_name] for _name in {names!r}}}, _file)\n"
+        f"_os.replace({str(tmp_path)!r}, {str(path)!r})\n"
+        "del _os, _pickle, _file"
+    )
+
+
+def restore_state_source(key: str) -> str:
+    return (
+        "import pickle as _pickle\n"
+        f"with open({str(state_path(key))!r}, 'rb') as _file:\n"
+        "    globals().update(_pickle.load(_file))\n"
+        "del _pickle, _file"
+    )
@@ -0,0 +1,244 @@
+"""
+Build the Jupyter book incrementally, rebuilding only the chapters that changed.
+
+Each chapter of `_toc.yml` is mapped to its files (the directory of its page:
+pages, notebooks, images, `shared_data.py`...) and to the registry hashes of the
+`shared_data` datasets its pages read. The content hashes of these files are
+compared to those recorded by the previous build, kept in a persisted build
+directory (`--build-dir`, e.g. a Docker cache mount):
+
+- a changed page is rebuilt (and executed again, if it is a notebook);
+- another changed file of a chapter, or a changed dataset, rebuilds all its pages;
+- changed Notion tables (`NOTION_ARTIFACT_DIR`) rebuild the MyST pages showing them;
+- any other change (`_config.yml`, `_toc.yml`, `_static/`, `helpers/`, the build
+  tools or the Python environment) rebuilds the whole book.
+
+Sphinx only reads again the documents modified since it last read them, but a
+checkout (or a `COPY` into a Docker image) modifies all of them: the files to
+rebuild are therefore given the start time of the build as modification time,
+and the unchanged files the modification time they were given by the build that
+last changed them.
+
+Usage: python -m build_tools.incremental_build [book directory] [--build-dir DIR] [--jobs N] [--all]
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import nbformat
+import yaml
+
+from build_tools import REPO_DIR, SRC_DIR, execution_cache
+from build_tools.build_book import build_book, load_execute_config
+from helpers.artifact import artifact_dir
+
+MANIFEST_FILE = 'incremental_build.json'
+
+PAGE_SUFFIXES = ('.md', '.ipynb')
+
+# Directories of the book that are not sources
+IGNORED_DIRS = ('_build', 'jupyter_execute', '__pycache__', '.ipynb_checkpoints')
+
+# Sources outside of the book that affect all the pages
+BUILD_SOURCES = [REPO_DIR / 'build_tools', REPO_DIR / 'convert_images.py']
+
+
+def file_hash(path: Path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 ** 2), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def source_hash(path: Path) -> str:
+    """
+    Hash of a file. Notebooks are hashed without their outputs, which the build writes in place.
+    """
+    if path.suffix != '.ipynb':
+        return file_hash(path)
+    nb = nbformat.read(path, as_version=4)
+    cells = [
+        [cell.cell_type, cell.source, {key: value for key, value in cell.metadata.items() if key != 'execution'}]
+        for cell in nb.cells
+    ]
+    content = json.dumps([cells, nb.metadata.get('kernelspec')], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def find_files(directory: Path) -> List[Path]:
+    files = []
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS and not d.startswith('.'))
+        files += [Path(root) / name for name in sorted(names) if not name.startswith('.') and not name.endswith('.pyc')]
+    return files
+
+
+def toc_files(entries: List[dict]) -> List[str]:
+    """
+    Files (document names) of a `_toc.yml` entry list, and of their sections.
+    """
+    files = []
+    for entry in entries:
+        if 'file' in entry:
+            files.append(entry['file'])
+        for key in ('parts', 'chapters', 'sections'):
+            files += toc_files(entry.get(key) or [])
+    return files
+
+
+def toc_chapters(book_dir: Path) -> Dict[str, Path]:
+    """
+    Directory of each chapter of the book, by document name. Top-level pages only own their own file.
+    """
+    with open(book_dir / '_toc.yml', 'r', encoding='utf-8') as file:
+        toc = yaml.safe_load(file)
+    chapters = {}
+    for docname in [toc['root'], *toc_files(toc.get('parts') or toc.get('chapters') or [])]:
+        directory = (book_dir / docname).parent
+        if directory != book_dir and not any(directory.is_relative_to(other) for other in chapters.values()):
+            chapters[docname] = directory
+    return chapters
+
+
+def build_fingerprint(book_dir: Path, files: Dict[str, str], chapters: Dict[str, Path]) -> str:
+    """
+    Hash of the files that are neither pages nor in a chapter, of the build tools and of the Python environment.
+    """
+    chapter_dirs = tuple(directory.relative_to(book_dir).as_posix() + '/' for directory in chapters.values())
+    shared = {
+        path: sha for path, sha in files.items()
+        if not path.startswith(chapter_dirs) and not ('/' not in path and Path(path).suffix in PAGE_SUFFIXES)
+    }
+    build_sources = {
+        path.relative_to(REPO_DIR).as_posix(): file_hash(path)
+        for source in BUILD_SOURCES for path in (find_files(source) if source.is_dir() else [source])
+    }
+    content = json.dumps([shared, build_sources, execution_cache.environment_fingerprint()], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def artifact_fingerprint() -> Optional[str]:
+    directory = artifact_dir()
+    if directory is None or not directory.is_dir():
+        return None
+    return hashlib.sha256(json.dumps([file_hash(path) for path in find_files(directory)]).encode()).hexdigest()
+
+
+def chapter_datasets(pages: List[Path]) -> List[str]:
+    sources = []
+    for path in pages:
+        if path.suffix == '.ipynb':
+            sources += [cell.source for cell in nbformat.read(path, as_version=4).cells if cell.cell_type == 'code']
+        else:
+            sources.append(path.read_text(encoding='utf-8'))
+    return execution_cache.dataset_hashes(sources)
+
+
+def load_manifest(path: Path) -> Optional[dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(path: Path, manifest: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix('.tmp'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path.with_suffix('.tmp'), path)
+
+
+def incremental_build(book_dir: Path = SRC_DIR, build_dir: Optional[Path] = None, jobs: Optional[int] = None,
+                      rebuild_all: bool = False) -> int:
+    """
+    Execute and build the changed pages of the book into `build_dir` (default: the book directory).
+    Returns the exit code of `jupyter-book build`.
+    """
+    book_dir = book_dir.resolve()
+    build_dir = (build_dir or book_dir).resolve()
+    manifest_path = build_dir / '_build' / MANIFEST_FILE
+    previous = load_manifest(manifest_path)
+    start = time.time_ns()
+
+    paths = {path.relative_to(book_dir).as_posix(): path for path in find_files(book_dir)}
+    files = {name: source_hash(path) for name, path in paths.items()}
+    chapters = toc_chapters(book_dir)
+    fingerprint = build_fingerprint(book_dir, files, chapters)
+    artifact = artifact_fingerprint()
+
+    datasets, changed = {}, set()
+    full = (
+        rebuild_all or previous is None or 'mtimes' not in previous or previous['fingerprint'] != fingerprint
+        or not (build_dir / '_build' / 'html').is_dir()
+    )
+    for docname, directory in chapters.items():
+        prefix = directory.relative_to(book_dir).as_posix() + '/'
+        names = [name for name in files if name.startswith(prefix)]
+        pages = [name for name in names if Path(name).suffix in PAGE_SUFFIXES]
+        datasets[docname] = chapter_datasets([paths[name] for name in pages])
+        if full:
+            continue
+        modified = [name for name in names if previous['files'].get(name) != files[name]]
+        modified += [name for name in previous['files'] if name.startswith(prefix) and name not in files]
+        if datasets[docname] != previous['datasets'].get(docname) or any(name not in pages for name in modified):
+            print(f"Chapter '{docname}' changed: rebuilding its {len(pages)} pages.")
+            changed.update(pages)
+        elif modified:
+            print(f"Chapter '{docname}' changed: rebuilding {', '.join(modified)}.")
+            changed.update(modified)
+    if not full:
+        # Top-level pages
+        changed.update(
+            name for name in files
+            if '/' not in name and Path(name).suffix in PAGE_SUFFIXES and previous['files'].get(name) != files[name]
+        )
+        if artifact != previous.get('artifact'):
+            print('The Notion tables changed: rebuilding the MyST pages.')
+            changed.update(name for name in files if name.endswith('.md'))
+
+    if full:
+        print('Rebuilding the whole book.')
+        build_book(book_dir, jobs, build=False)
+    else:
+        print(f'Rebuilding {len(changed)} pages.')
+        # Execute the changed notebooks even if they have (outdated) outputs
+        force = load_execute_config(book_dir).get('execute_notebooks', 'auto') != 'off'
+        notebooks = [paths[name] for name in changed if name.endswith('.ipynb')]
+        build_book(book_dir, jobs, force=force, build=False, notebooks=notebooks)
+
+    # Sphinx reads again the documents (and dependencies) modified since it last read them
+    mtimes = {}
+    for name, path in paths.items():
+        if full or name in changed or previous['files'].get(name) != files[name] or name not in previous['mtimes']:
+            mtimes[name] = start
+        else:
+            mtimes[name] = previous['mtimes'][name]
+        os.utime(path, ns=(mtimes[name], mtimes[name]))
+
+    command = ['jupyter-book', 'build', str(book_dir), '--path-output', str(build_dir)] + (['--all'] if full else [])
+    returncode = subprocess.run(command).returncode
+    if returncode == 0:
+        save_manifest(manifest_path, {
+            'fingerprint': fingerprint, 'artifact': artifact, 'files': files, 'mtimes': mtimes, 'datasets': datasets,
+        })
+    print(f'Built in {(time.time_ns() - start) / 1e9:.1f} s.')
+    return returncode
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('book_dir', nargs='?', type=Path, default=SRC_DIR, help='Directory of the book (default: src/).')
+    parser.add_argument('--build-dir', type=Path, help='Persisted directory of the build, containing `_build/` (default: the book directory).')
+    parser.add_argument('--jobs', type=int, help='Number of kernels running in parallel (default: from the cores and memory).')
+    parser.add_argument('--all', action='store_true', help='Rebuild the whole book.')
+    args = parser.parse_args()
+
+    sys.exit(incremental_build(args.book_dir, args.build_dir, args.jobs, args.all))
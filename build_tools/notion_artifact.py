@@ -0,0 +1,33 @@
+"""
+Fetch and render the Notion tables once for the whole book build.
+
+Usage: python -m build_tools.notion_artifact [output directory]
+
+The book pages read the tables from the output directory while the
+`NOTION_ARTIFACT_DIR` environment variable points to it. Registered in
+`src/_config.yml` (`sphinx.local_extensions`), this module also copies the JSON
+data sources of the artifact to `_static/notion/` of the site.
+"""
+import sys
+from pathlib import Path
+
+from build_tools import SRC_DIR
+from helpers.artifact import DATA_SOURCES_DIR, artifact_dir, write_artifact
+
+DEFAULT_ARTIFACT_DIR = SRC_DIR / '_build' / 'notion'
+
+def add_data_sources(app, config) -> None:
+    directory = artifact_dir()
+    if directory is not None and (directory / DATA_SOURCES_DIR).is_dir():
+        # Copied to `_static/notion/`
+        config.html_static_path.append(str((directory / DATA_SOURCES_DIR.parent).resolve()))
+
+
+def setup(app):
+    app.connect('config-inited', add_data_sources)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
+
+
+if __name__ == '__main__':
+    directory = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ARTIFACT_DIR
+    write_artifact(directory)
@@ -0,0 +1,133 @@
+"""
+Sphinx extension serving responsive variants of the images of the book.
+
+Registered in `src/_config.yml` (`sphinx.local_extensions`). Once the HTML pages
+are written, the images copied to `_images/` get resized variants (WebP and AVIF
+when supported, see `convert_images.make_derivatives`) in `_images/responsive/`,
+and the `<img>` tags of the pages are wrapped in a `<picture>` element with a
+`srcset` per format, so that browsers download the smallest suitable file.
+"""
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict
+
+from sphinx.util import logging
+
+from build_tools import REPO_DIR
+
+# Make `convert_images` importable
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+from convert_images import make_derivatives
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = ('.jpeg', '.jpg', '.png')
+
+RESPONSIVE_DIR = 'responsive'
+
+# Images are at most as wide as the content column of the book
+SIZES = '(max-width: 960px) 100vw, 960px'
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+IMG_TAG = re.compile(r'<img\b[^>]*>')
+SRC_ATTRIBUTE = re.compile(r'\ssrc="(?P<prefix>(?:\.\./)*)_images/(?P<name>[^"/]+)"')
+
+
+def build_derivatives(images_dir: Path, max_workers=None) -> Dict[str, dict]:
+    """
+    Variants of the images of `images_dir`, by image name. Stale variants are removed.
+    """
+    out_dir = images_dir / RESPONSIVE_DIR
+    out_dir.mkdir(exist_ok=True)
+    names = sorted(path.name for path in images_dir.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+
+    derivatives = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {name: executor.submit(make_derivatives, str(images_dir / name), str(out_dir)) for name in names}
+        for name, future in futures.items():
+            try:
+                derivatives[name] = future.result()
+            except OSError as error:
+                logger.warning(f"Could not generate the responsive variants of '{name}': {error}")
+
+    used = {variant for image in derivatives.values() for variants in image['variants'].values() for variant, _ in variants}
+    for path in out_dir.iterdir():
+        if path.name not in used:
+            path.unlink()
+
+    return derivatives
+
+
+def srcset(prefix: str, variants, original: str = None, width: int = None) -> str:
+    candidates = [f'{prefix}_images/{RESPONSIVE_DIR}/{name} {w}w' for name, w in variants]
+    if original is not None:
+        candidates.append(f'{prefix}_images/{original} {width}w')
+    return ', '.join(candidates)
+
+
+def responsive_img(tag: str, derivatives: Dict[str, dict], lazy: bool) -> str:
+    """
+    Wrap an `<img>` tag pointing to `_images/` in a `<picture>` element listing its variants.
+    """
+    match = SRC_ATTRIBUTE.search(tag)
+    if 'srcset=' in tag or match is None or match['name'] not in derivatives:
+        return tag
+    prefix, name = match['prefix'], match['name']
+    image = derivatives[name]
+    (width, height), variants = image['size'], image['variants']
+    *modern, original = variants
+    if not variants[original]:
+        # Already smaller than the smallest variant
+        return tag
+
+    attributes = f' srcset="{srcset(prefix, variants[original], name, width)}" sizes="{SIZES}"'
+    if 'width=' not in tag and 'height=' not in tag:
+        # Reserve the space of the image before it is loaded
+        attributes += f' width="{width}" height="{height}"'
+    if lazy and 'loading=' not in tag:
+        attributes += ' loading="lazy" decoding="async"'
+    img = tag[:match.end()] + attributes + tag[match.end():]
+
+    sources = ''.join(
+        f'<source type="{MIME_TYPES[fmt]}" srcset="{srcset(prefix, variants[fmt])}" sizes="{SIZES}" />'
+        for fmt in modern
+    )
+    return f'<picture>{sources}{img}</picture>'
+
+
+def rewrite_page(path: Path, derivatives: Dict[str, dict]) -> bool:
+    html = path.read_text(encoding='utf-8')
+    count = 0
+
+    def replace(match: re.Match) -> str:
+        nonlocal count
+        if SRC_ATTRIBUTE.search(match[0]) is None:
+            return match[0]
+        count += 1
+        # The first image of the content (usually the header of a page) is likely visible on load
+        return responsive_img(match[0], derivatives, lazy=count > 1)
+
+    rewritten = IMG_TAG.sub(replace, html)
+    if rewritten == html:
+        return False
+    path.write_text(rewritten, encoding='utf-8')
+    return True
+
+
+def build_finished(app, exception) -> None:
+    images_dir = Path(app.outdir) / '_images'
+    if exception is not None or app.builder.format != 'html' or not images_dir.is_dir():
+        return
+
+    derivatives = build_derivatives(images_dir, app.parallel if app.parallel > 1 else None)
+    pages = sum(rewrite_page(path, derivatives) for path in Path(app.outdir).rglob('*.html'))
+    logger.info(f'responsive images: {len(derivatives)} images, {pages} pages updated')
+
+
+def setup(app):
+    app.connect('build-finished', build_finished)
+    return {'parallel_read_safe': True, 'parallel_write_safe': True}
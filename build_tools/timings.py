@@ -0,0 +1,26 @@
+"""
+Summarize the helpers timings recorded during a book build.
+
+Usage: FIELD_GUIDE_TIMINGS=timings.jsonl jupyter-book build src/
+       python -m build_tools.timings timings.jsonl [--by cwd|database|pid] [--json]
+"""
+import argparse
+import json
+
+from build_tools import SRC_DIR  # noqa: F401 (makes `helpers` importable)
+from helpers.timing import load_timings, summarize_timings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='JSON lines file written through FIELD_GUIDE_TIMINGS.')
+    parser.add_argument('--by', help='Also group the stages by this record field, for example `cwd` (the page).')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON.')
+    args = parser.parse_args()
+
+    summary = summarize_timings(load_timings(args.path), key=args.by)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f'{"stage":<60} {"count":>6} {"total (s)":>10} {"max (s)":>9} {"rows":>8} {"bytes":>12}')
+        for name, entry in sorted(summary.items(), key=lambda item: -item[1]['seconds']):
+            print(f'{name:<60} {entry["count"]:>6} {entry["seconds"]:>10.3f} {entry["max_seconds"]:>9.3f} {entry["rows"]:>8} {entry["bytes"]:>12}')
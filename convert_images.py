@@ -1,22 +1,205 @@
+"""
+Convert the PNG images of a directory tree to JPEG.
+
+Each `<dir>/<name>.png` is converted to `<dir>/jpeg/<name>.jpeg`. A manifest at
+the root of the tree records the size, modification time and hash of every
+converted image, so that unchanged images are skipped without being decoded.
+The conversions run in a pool of processes.
+
+The module also generates the responsive derivatives of the images of the book
+(smaller widths, in WebP and AVIF when Pillow supports them), see
+`build_tools/responsive_images.py`.
+
+Usage: python convert_images.py DIRECTORY [--workers N] [--force]
+"""
+import argparse
+import hashlib
+import json
 import os
-import sys
-from PIL import Image
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, features
+
+MANIFEST_FILE = '.convert_images.json'
+
+OUTPUT_DIR = 'jpeg'
+
+# Widths of the responsive derivatives (only those smaller than the image are generated)
+RESPONSIVE_WIDTHS = (480, 960, 1440)
+
+# Modern formats of the derivatives, in order of preference; the original format is always generated
+RESPONSIVE_FORMATS = ('avif', 'webp')
+
+SAVE_OPTIONS = {
+    'avif': {'quality': 60},
+    'webp': {'quality': 80, 'method': 4},
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+}
+
+
+def file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 ** 2), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def find_images(directory: str) -> List[Tuple[str, str]]:
+    """
+    (PNG, JPEG) path pairs of the directory tree.
+    """
+    pairs = []
+    for root, dirs, files in os.walk(directory):
+        # Do not descend into the output directories
+        dirs[:] = sorted(d for d in dirs if d != OUTPUT_DIR and not d.startswith('.'))
+        for filename in sorted(files):
+            if filename.endswith('.png'):
+                pairs.append((
+                    os.path.join(root, filename),
+                    os.path.join(root, OUTPUT_DIR, filename[:-4] + '.jpeg'),
+                ))
+    return pairs
+
+
+def load_manifest(directory: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(directory: str, manifest: Dict[str, dict]) -> None:
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def is_up_to_date(entry: Optional[dict], stat: os.stat_result, src_path: str, out_path: str) -> Tuple[bool, Optional[str]]:
+    """
+    Whether the image needs no conversion, and its hash if it had to be computed.
+    """
+    if not os.path.exists(out_path):
+        return False, None
+    if entry is None:
+        # Converted before the manifest existed: keep the JPEG
+        return True, file_hash(src_path)
+    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return True, entry['sha256']
+    # Touched (e.g. by a checkout) but possibly unchanged
+    sha256 = file_hash(src_path)
+    return sha256 == entry['sha256'], sha256
 
-def convert_png_to_jpeg(directory):
+
+def convert_image(src_path: str, out_path: str) -> Tuple[int, int]:
+    """
+    Convert one image and return the sizes of the source and converted files.
+    """
+    with Image.open(src_path) as img:
+        img.convert('RGB').save(out_path)
+    return os.path.getsize(src_path), os.path.getsize(out_path)
+
+
+def supported_formats(formats=RESPONSIVE_FORMATS) -> Tuple[str, ...]:
+    return tuple(fmt for fmt in formats if features.check(fmt))
+
+
+def derivative_name(src_path: str, sha256: str, width: int, fmt: str) -> str:
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return f'{stem}-{sha256[:10]}-{width}.{fmt}'
+
+
+def make_derivatives(src_path: str, out_dir: str, widths=RESPONSIVE_WIDTHS, formats=RESPONSIVE_FORMATS) -> dict:
+    """
+    Write the resized variants of an image to `out_dir` and describe them.
+
+    Returns the size of the image and, for each format (modern formats first, then the
+    original one), the `(file name, width)` of its variants. The file names contain a hash
+    of the source, so that existing variants are reused instead of being encoded again.
+    """
+    sha256 = file_hash(src_path)
+    with Image.open(src_path) as img:
+        size = img.size
+        original = 'png' if img.format == 'PNG' else 'jpeg'
+        variants = {fmt: [] for fmt in (*supported_formats(formats), original)}
+        for width in sorted(w for w in widths if w < size[0]):
+            resized = None
+            for fmt in variants:
+                name = derivative_name(src_path, sha256, width, fmt)
+                path = os.path.join(out_dir, name)
+                if not os.path.exists(path):
+                    if resized is None:
+                        height = round(size[1] * width / size[0])
+                        # Palette and 16-bit images cannot be resampled (nor saved as WebP or AVIF) as such
+                        mode = img.mode if img.mode in ('RGB', 'RGBA', 'L') else 'RGBA'
+                        resized = img.convert(mode).resize((width, height), Image.LANCZOS)
+                    image = resized.convert('RGB') if fmt == 'jpeg' else resized
+                    image.save(path + '.tmp', format=fmt.upper(), **SAVE_OPTIONS[fmt])
+                    os.replace(path + '.tmp', path)
+                variants[fmt].append((name, width))
+    return {'size': size, 'variants': variants}
+
+
+def convert_png_to_jpeg(directory: str, max_workers: Optional[int] = None, force: bool = False) -> None:
     if not os.path.exists(directory):
         print(f"Directory '{directory}' does not exist.")
         return
 
-    for filename in os.listdir(directory):
-        if filename.endswith(".png"):
-            file_path = os.path.join(directory, filename)
-            with Image.open(file_path) as img:
-                rgb_img = img.convert('RGB')
-                out_path = os.path.join(directory, 'jpeg', filename[:-4] + '.jpeg')
-                if not os.path.exists(out_path):
-                    rgb_img.save(out_path)
-                    print(f"Converted '{filename}' to JPEG format.")
-
-if __name__=='__main__':
-    _, directory = sys.argv  # Example folder: './images'
-    convert_png_to_jpeg(directory)
+    start = time.perf_counter()
+    manifest = load_manifest(directory)
+    pairs = find_images(directory)
+
+    jobs = {}
+    for src_path, out_path in pairs:
+        key = os.path.relpath(src_path, directory)
+        stat = os.stat(src_path)
+        up_to_date, sha256 = (False, None) if force else is_up_to_date(manifest.get(key), stat, src_path, out_path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        if up_to_date:
+            manifest[key] = entry
+        else:
+            jobs[key] = (src_path, out_path, entry)
+
+    converted_bytes = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for key, (src_path, out_path, entry) in jobs.items():
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            futures[key] = executor.submit(convert_image, src_path, out_path)
+
+        for key, future in futures.items():
+            src_path, out_path, entry = jobs[key]
+            try:
+                src_size, _ = future.result()
+            except OSError as error:
+                print(f"Failed to convert '{key}': {error}")
+                manifest.pop(key, None)
+                continue
+            converted_bytes += src_size
+            manifest[key] = {**entry, 'sha256': entry['sha256'] or file_hash(src_path)}
+            print(f"Converted '{key}' to JPEG format.")
+
+    # Forget the images that were removed
+    keys = {os.path.relpath(src_path, directory) for src_path, _ in pairs}
+    save_manifest(directory, {key: entry for key, entry in manifest.items() if key in keys})
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(futures)} converted, {len(pairs) - len(futures)} up to date in {elapsed:.2f} s "
+        f"({len(futures) / elapsed:.1f} images/s, {converted_bytes / 1e6 / elapsed:.1f} MB/s)."
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help="Root of the images, e.g. './src/sections'.")
+    parser.add_argument('--workers', type=int, help='Number of processes (default: number of CPUs).')
+    parser.add_argument('--force', action='store_true', help='Convert all the images again.')
+    args = parser.parse_args()
+
+    convert_png_to_jpeg(args.directory, args.workers, args.force)
@@ -1,30 +1,45 @@
+// Bind the tag buttons of a table to its search input. The rows of the tables loading
+// their data source are only created when displayed, so this is called again after
+// each draw of these tables (see `helpers.rendering.DEFERRED_TABLE_TEMPLATE`).
+function bindTagButtons(tableElement) {
+    var inputElement = tableElement.querySelector('.dataTables_filter input, .dt-search input');
+    if (!inputElement) {
+        return;
+    }
+    var updateTagButtons = () => {
+        var inputValue = inputElement.value;
+        tableElement.querySelectorAll('.btn').forEach(btn => {
+            if (inputValue.includes(btn.textContent)) {
+                if (btn.classList.contains('btn-light')) {
+                    btn.classList.remove('btn-light');
+                    btn.classList.add('btn-secondary');
+                }
+            } else {
+                if (btn.classList.contains('btn-secondary')) {
+                    btn.classList.remove('btn-secondary');
+                    btn.classList.add('btn-light');
+                }
+            };
+        });
+    };
+    if (!inputElement.dataset.tagButtons) {
+        inputElement.dataset.tagButtons = 'bound';
+        inputElement.addEventListener('input', updateTagButtons);
+    }
+    // Highlight the buttons of the rows drawn since the last search
+    updateTagButtons();
+    tableElement.querySelectorAll('.btn').forEach(btn => {
+        btn.onclick = function() { insertText(btn, inputElement) };
+    });
+}
+
+window.bindTagButtons = bindTagButtons;
+
 window.onload = () => {
     setTimeout(function() {
-        var tableElements = document.querySelectorAll('.dataTables_wrapper');
+        var tableElements = document.querySelectorAll('.dataTables_wrapper, .dt-container');
         if (tableElements.length > 0) {
-            tableElements.forEach(tableElement => {
-                var inputElement = tableElement.querySelector('.dataTables_filter input');
-                var allTagButtons = tableElement.querySelectorAll('.btn');
-                inputElement.addEventListener('input', () => {
-                    var inputValue = inputElement.value;
-                    allTagButtons.forEach(btn => {
-                        if (inputValue.includes(btn.textContent)) {
-                            if (btn.classList.contains('btn-light')) {
-                                btn.classList.remove('btn-light');
-                                btn.classList.add('btn-secondary');
-                            }
-                        } else {
-                            if (btn.classList.contains('btn-secondary')) {
-                                btn.classList.remove('btn-secondary');
-                                btn.classList.add('btn-light');
-                            }
-                        };
-                    });
-                });
-                allTagButtons.forEach(btn => {
-                    btn.onclick = function() { insertText(btn, inputElement) };
-                });
-            })
+            tableElements.forEach(bindTagButtons);
         } else {
             console.log('No input elements found.');
         }
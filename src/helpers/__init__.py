@@ -1,14 +1,85 @@
 from itables import show
-from functools import partial
+from functools import lru_cache, partial
 from typing import List
 
+import pandas as pd
+
+from helpers.artifact import HIDDEN_COLUMNS, ONLINE_RESOURCES, SOFTWARE_TOOLS, data_source_url, load_artifact
 from helpers.notion_api import get_online_resources_dataframe, get_software_tools_dataframe
+from helpers.rendering import render_deferred_table
+from helpers.tag_index import TagIndex
+from helpers.timing import stage
+
+
+@lru_cache(maxsize=None)
+def _online_resources_dataframe() -> pd.DataFrame:
+    with stage('artifact_load', database='online_resources') as timing:
+        df = load_artifact(ONLINE_RESOURCES)
+        timing['rows'] = None if df is None else len(df)
+    return df if df is not None else get_online_resources_dataframe()
+
+
+@lru_cache(maxsize=None)
+def _software_tools_dataframe() -> pd.DataFrame:
+    with stage('artifact_load', database='software_tools') as timing:
+        df = load_artifact(SOFTWARE_TOOLS)
+        timing['rows'] = None if df is None else len(df)
+    return df if df is not None else get_software_tools_dataframe()
+
+
+@lru_cache(maxsize=None)
+def _online_resources_index() -> TagIndex:
+    return TagIndex(_online_resources_dataframe()['_keywords'])
+
+
+@lru_cache(maxsize=None)
+def _software_tools_index() -> TagIndex:
+    df = _software_tools_dataframe()
+    return TagIndex(df['_used_for'], df['_keywords'])
+
+
+_DATAFRAME_LOADERS = {
+    'DATAFRAME_ONLINE_RESOURCES': _online_resources_dataframe,
+    'DATAFRAME_SOFTWARE_TOOLS': _software_tools_dataframe,
+}
+
+
+def __getattr__(name: str):
+    """
+    Load the Notion dataframes lazily, on first access to `DATAFRAME_*`.
+    """
+    if name in _DATAFRAME_LOADERS:
+        return _DATAFRAME_LOADERS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_DATABASE_LOADERS = {
+    ONLINE_RESOURCES: _online_resources_dataframe,
+    SOFTWARE_TOOLS: _software_tools_dataframe,
+}
+
+
+def _show(stage_name: str, database: str, df: pd.DataFrame, **kwargs):
+    """
+    Show a filtered table. When the build wrote a data source for its database, the page only
+    embeds the positions of its rows, loaded from the shared data source by the browser.
+    """
+    with stage(stage_name, rows=len(df)) as timing:
+        url = data_source_url(database)
+        full_df = _DATABASE_LOADERS[database]() if url is not None else None
+        if full_df is None or list(df.columns) != [c for c in full_df.columns if c not in HIDDEN_COLUMNS[database]]:
+            return show(df, **kwargs)
+        timing['deferred'] = True
+        # IPython is only imported when showing a table, to keep `import helpers` fast
+        from IPython.display import HTML, display
+        rows = full_df.index.get_indexer(df.index)
+        display(HTML(render_deferred_table(url, rows, df.columns, **kwargs)))
 
-DATAFRAME_ONLINE_RESOURCES = get_online_resources_dataframe()
-DATAFRAME_SOFTWARE_TOOLS = get_software_tools_dataframe()
 
 show_online_resources = partial(
-    show,
+    _show,
+    'show_online_resources',
+    ONLINE_RESOURCES,
     classes="display compact", 
     columnDefs=[
         {"width": "100%", "targets": [0]},
@@ -20,7 +91,9 @@ show_online_resources = partial(
 )
 
 show_software_tools = partial(
-    show,
+    _show,
+    'show_software_tools',
+    SOFTWARE_TOOLS,
     classes="display compact", 
     columnDefs=[
         {"className": "dt-left", "targets": "_all"}
@@ -31,24 +104,44 @@ show_software_tools = partial(
 )
 
 
-def filter_online_resources(tags: List[str]):
-    df = DATAFRAME_ONLINE_RESOURCES.copy()
-    mask = df['Keywords'].str.contains('|'.join(tags), na=False)
-    filtered_df = df[mask].copy()
-    filtered_df.drop(['Keywords', 'Favourite'], axis='columns', inplace=True)
+def filter_online_resources(tags: List[str], match: str = 'any') -> pd.DataFrame:
+    """
+    Online resources tagged with any (or all, with `match='all'`) of the `tags`.
+
+    Results are memoized per tag set: do not modify the returned dataframe in place.
+    """
+    with stage('filter_online_resources') as timing:
+        df = _filter_online_resources(frozenset(tags), match)
+        timing['rows'] = len(df)
+    return df
+
+
+@lru_cache(maxsize=None)
+def _filter_online_resources(tags: frozenset, match: str) -> pd.DataFrame:
+    rows = _online_resources_index().rows(tags, match)
+    filtered_df = _online_resources_dataframe().iloc[rows]
+    return filtered_df.drop(HIDDEN_COLUMNS[ONLINE_RESOURCES], axis='columns')
+
 
-    return filtered_df
+def filter_software_tools(tags: List[str], match: str = 'any') -> pd.DataFrame:
+    """
+    Software tools used for or tagged with any (or all, with `match='all'`) of the `tags`.
 
+    Results are memoized per tag set: do not modify the returned dataframe in place.
+    """
+    with stage('filter_software_tools') as timing:
+        df = _filter_software_tools(frozenset(tags), match)
+        timing['rows'] = len(df)
+    return df
 
-def filter_software_tools(tags: List[str]):
-    df = DATAFRAME_SOFTWARE_TOOLS.copy()
-    mask = df['Used for'].str.contains('|'.join(tags), na=False) | df['Keywords'].str.contains('|'.join(tags), na=False)
-    filtered_df = df[mask].copy()
-    filtered_df.drop(['Used for', 'Keywords', 'Favourite'], axis='columns', inplace=True)
 
-    return filtered_df
+@lru_cache(maxsize=None)
+def _filter_software_tools(tags: frozenset, match: str) -> pd.DataFrame:
+    rows = _software_tools_index().rows(tags, match)
+    filtered_df = _software_tools_dataframe().iloc[rows]
+    return filtered_df.drop(HIDDEN_COLUMNS[SOFTWARE_TOOLS], axis='columns')
 
 
 if __name__ == '__main__':
-    print(DATAFRAME_SOFTWARE_TOOLS.head())
-    print(DATAFRAME_ONLINE_RESOURCES.head())
\ No newline at end of file
+    print(_software_tools_dataframe().head())
+    print(_online_resources_dataframe().head())
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Build-wide artifact of the rendered Notion tables.
+
+A pre-build step (`build_tools/notion_artifact.py`) fetches and renders both
+databases once and writes them as Parquet files. While `NOTION_ARTIFACT_DIR`
+points to these files (the build sets it for the notebook kernels), `helpers`
+reads the tables from there instead of querying Notion and rendering them again
+in every page.
+
+Each table is also written as a compact JSON data source (the displayed
+columns only, in the `split` orient of pandas), copied to `_static/notion/` of
+the site by the `build_tools.notion_artifact` Sphinx extension. The pages then
+load their rows from it instead of embedding them (see `helpers.show_*`).
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from helpers.notion_api import get_dataframes
+
+ONLINE_RESOURCES = 'online_resources'
+SOFTWARE_TOOLS = 'software_tools'
+
+# Columns used to filter the tables, which are not displayed
+HIDDEN_COLUMNS = {
+    ONLINE_RESOURCES: ['_keywords', 'Keywords', 'Favourite'],
+    SOFTWARE_TOOLS: ['_used_for', '_keywords', 'Used for', 'Keywords', 'Favourite'],
+}
+
+# Directory of the JSON data sources in the artifact, and in `_static/` of the site
+DATA_SOURCES_DIR = Path('static') / 'notion'
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+
+
+def artifact_dir() -> Optional[Path]:
+    path = os.environ.get('NOTION_ARTIFACT_DIR')
+    return Path(path) if path else None
+
+
+def load_artifact(name: str) -> Optional[pd.DataFrame]:
+    """
+    Read a rendered table from the build artifact, or return `None` if there is none.
+    """
+    directory = artifact_dir()
+    if directory is None:
+        return None
+    path = directory / f'{name}.parquet'
+    if not path.exists():
+        return None
+    return pd.read_parquet(path)
+
+
+def data_source_url(name: str) -> Optional[str]:
+    """
+    URL of the JSON data source of a table, relative to the page being executed, or `None` if there is none.
+    """
+    directory = artifact_dir()
+    if directory is None or not (directory / DATA_SOURCES_DIR / f'{name}.json').exists():
+        return None
+    static_dir = Path(os.path.relpath(SRC_DIR, Path.cwd())) / '_static'
+    return (static_dir / DATA_SOURCES_DIR.name / f'{name}.json').as_posix()
+
+
+def write_data_source(directory: Path, name: str, df: pd.DataFrame) -> None:
+    path = directory / DATA_SOURCES_DIR / f'{name}.json'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    columns = [column for column in df.columns if column not in HIDDEN_COLUMNS[name]]
+    tmp_path = path.with_suffix('.json.tmp')
+    df[columns].to_json(tmp_path, orient='split', index=False)
+    os.replace(tmp_path, path)
+
+
+def write_artifact(directory: Path) -> None:
+    """
+    Fetch and render both Notion databases and write them to `directory`.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    online_resources, software_tools = get_dataframes()
+    for name, df in ((ONLINE_RESOURCES, online_resources), (SOFTWARE_TOOLS, software_tools)):
+        tmp_path = directory / f'{name}.parquet.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, directory / f'{name}.parquet')
+        write_data_source(directory, name, df)
+        print(f"Wrote {len(df)} rows to '{directory / name}.parquet'.")
+
@@ -0,0 +1,207 @@
+"""
+Central registry of the datasets used in the field guide notebooks.
+
+The `shared_data.py` module of each section re-exports `DATASET` from here, so
+that all the notebooks share one registry and one local cache. To download and
+verify every registered file in one go (for example when preparing a JupyterHub
+image or a build machine), run from the `src/` directory:
+
+    python -m helpers.datasets prefetch [--workers 8] [--verify] [file names...]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import pooch
+
+from helpers.downloaders import RangeDownloader
+from helpers.image_loader import load_image
+from helpers.zarr_conversion import ConvertToOmeZarr, open_ome_zarr
+
+BASE_URL = "https://zenodo.org/record/8099852/files/"
+
+REGISTRY = {
+    # Detection and tracking
+    "cell_tracking_2d.tif": "md5:43f973785dcfbad38334fbf682a36d0f",
+    # Image data visualization
+    "grains.tif": "md5:38b46d0a9c1b7ca9c866c2a11138a65a",
+    "drosophila_trachea.tif": "md5:d595ac271779936e255afd0508cca43f",
+    # Image registration
+    "snow_3d.tif": "md5:66c5130131f7707f5796c17916d70cc2",
+    "M2EA05-01-bin4.tif": "md5:d8358c14acc5ae65aee67887201c1bb1",
+    "M2EA05-05-bin4.tif": "md5:5a2d68d0d8425e9da7118c921d682a5f",
+    "M2EA05-01-bin4-lab.tif": "md5:6f4eef96d25ca7f16209e029a26c6828",
+    # Image segmentation
+    "deepslide.png": "md5:67d2dac6f327e2d3749252d46799861a",
+    # Performance optimization (approx. 100 Mb)
+    "hubble.tif": None,
+}
+
+# Custom URLs for the files that are not in the default Zenodo record
+URLS = {
+    "M2EA05-01-bin4.tif": "https://zenodo.org/record/7140837/files/M2EA05-01-bin4.tif",
+    "M2EA05-05-bin4.tif": "https://zenodo.org/record/7140837/files/M2EA05-05-bin4.tif",
+    "M2EA05-01-bin4-lab.tif": "https://zenodo.org/record/7140837/files/M2EA05-01-bin4-lab.tif",
+    "hubble.tif": "https://stsci-opo.org/STScI-01EVSZWCFZVP2R5ZRV7HEZAGP6.tif",
+}
+
+# Set to 1 to hash the cached files again on every fetch
+FORCE_VERIFY = os.environ.get('SHARED_DATA_VERIFY') == '1'
+
+# Sidecar file recording the cached files whose hash has already been checked
+VERIFIED_FILE = '.verified.json'
+
+
+class FieldGuideDataset(pooch.Pooch):
+    """
+    Pooch that skips hashing cached files again once they have been verified.
+
+    After a successful fetch, the size, modification time and inode of the file
+    are recorded with its registry hash in a sidecar file of the cache. Later
+    fetches of an unchanged file return it directly instead of hashing it again;
+    pass `verify=True` (or set `SHARED_DATA_VERIFY=1`) to force the check.
+
+    Files are downloaded with a `RangeDownloader` unless another downloader is given,
+    so that large files are fetched in parallel chunks and interrupted downloads resume.
+    """
+    _lock = threading.Lock()
+
+    @property
+    def verified_path(self) -> Path:
+        return Path(self.abspath) / VERIFIED_FILE
+
+    def _load_verified(self) -> Dict[str, dict]:
+        try:
+            with open(self.verified_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _file_signature(self, fname: str) -> Optional[dict]:
+        try:
+            stat = os.stat(Path(self.abspath) / fname)
+        except OSError:
+            return None
+        return {
+            'hash': self.registry[fname],
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'inode': stat.st_ino,
+        }
+
+    def is_verified(self, fname: str) -> bool:
+        signature = self._file_signature(fname)
+        return signature is not None and self._load_verified().get(fname) == signature
+
+    def _mark_verified(self, fname: str) -> None:
+        signature = self._file_signature(fname)
+        if signature is None:
+            return
+        with self._lock:
+            # Re-read the sidecar so that the files verified by other processes are kept
+            verified = self._load_verified()
+            verified[fname] = signature
+            tmp_path = self.verified_path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as file:
+                    json.dump(verified, file, indent=1)
+                os.replace(tmp_path, self.verified_path)
+            except OSError:
+                # A read-only cache only means that files get hashed again next time
+                pass
+
+    def fetch(self, fname, processor=None, downloader=None, progressbar=False, verify=False):
+        self._assert_file_in_registry(fname)
+        if not (verify or FORCE_VERIFY) and self.registry[fname] is not None and self.is_verified(fname):
+            full_path = str(Path(self.abspath) / fname)
+            if processor is not None:
+                return processor(full_path, 'fetch', self)
+            return full_path
+
+        if downloader is None and self.get_url(fname).startswith(('http://', 'https://')):
+            downloader = RangeDownloader()
+
+        result = super().fetch(fname, processor=processor, downloader=downloader, progressbar=progressbar)
+        if self.registry[fname] is not None:
+            self._mark_verified(fname)
+
+        return result
+
+    def load(self, fname: str, lazy: bool = False, max_workers: Optional[int] = None):
+        """
+        Fetch an image and read it with `helpers.image_loader.load_image` (memory-mapped if possible).
+        """
+        return load_image(self.fetch(fname), lazy=lazy, max_workers=max_workers)
+
+    def fetch_zarr(self, fname: str, axes: Optional[str] = None, chunks: Optional[Dict[str, int]] = None, level: int = 0):
+        """
+        Fetch a TIFF file and return it as a lazy dask array, read from a chunked OME-Zarr copy in the cache.
+
+        A copy is written on the first call with each `axes` and `chunks` (and when the file is updated).
+        The axes of the array are in OME order (t, c, z, y, x); see `helpers.zarr_conversion` for the defaults.
+        """
+        path = self.fetch(fname, processor=ConvertToOmeZarr(axes, chunks))
+        return open_ome_zarr(path, level)
+
+
+def create_dataset() -> FieldGuideDataset:
+    dataset = pooch.create(
+        path=pooch.os_cache("field-guide"),  # default path
+        base_url=BASE_URL,
+        registry=REGISTRY,
+        env="SHARED_DATA",  # if exists, will overwrite `path`
+        urls=URLS,
+        # Interrupted downloads resume from the chunks already written
+        retry_if_failed=2,
+    )
+    return FieldGuideDataset(
+        path=dataset.path,
+        base_url=dataset.base_url,
+        registry=dataset.registry,
+        urls=dataset.urls,
+        retry_if_failed=dataset.retry_if_failed,
+    )
+
+
+DATASET = create_dataset()
+
+
+def prefetch(names: Optional[Iterable[str]] = None, max_workers: int = 4, verify: bool = False) -> Dict[str, Exception]:
+    """
+    Download (if needed) and verify registered files with a bounded pool of threads.
+
+    Returns the errors of the files that could not be fetched, by file name.
+    """
+    names = list(names) if names else list(DATASET.registry)
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(DATASET.fetch, name, verify=verify): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                path = future.result()
+            except Exception as error:
+                errors[name] = error
+                print(f"Failed to fetch '{name}': {error}")
+            else:
+                print(f"Fetched '{name}' to '{path}'.")
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    prefetch_parser = subparsers.add_parser('prefetch', help='Download and verify the registered files.')
+    prefetch_parser.add_argument('names', nargs='*', help='File names to fetch (default: all the registry).')
+    prefetch_parser.add_argument('--workers', type=int, default=4, help='Number of parallel downloads.')
+    prefetch_parser.add_argument('--verify', action='store_true', help='Hash the cached files again, even if already verified.')
+    args = parser.parse_args()
+
+    if args.command == 'prefetch':
+        errors = prefetch(args.names, args.workers, args.verify)
+        sys.exit(1 if errors else 0)
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Set
+
+import requests
+
+# Files smaller than this are downloaded in a single stream
+MIN_RANGE_SIZE = 32 * 1024 ** 2
+
+CHUNK_SIZE = 16 * 1024 ** 2
+
+# Directory of the cache holding the partial downloads
+PARTIAL_DIR = '.partial'
+
+
+class RangeDownloader:
+    """
+    Pooch downloader fetching large files as concurrent HTTP range requests.
+
+    The file is assembled in a partial file of the cache, next to a small JSON
+    state listing the chunks already written. An interrupted download resumes
+    from the missing chunks on the next fetch, as long as the server reports the
+    same size and validator (ETag or Last-Modified). Servers that do not support
+    ranges, and small files, are downloaded in a single stream.
+    """
+    def __init__(
+        self,
+        chunk_size: int = CHUNK_SIZE,
+        max_workers: int = 4,
+        min_range_size: int = MIN_RANGE_SIZE,
+        timeout: float = 60,
+    ):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.min_range_size = min_range_size
+        self.timeout = timeout
+
+    def _partial_paths(self, url: str, output_file: str, pooch) -> tuple:
+        directory = Path(pooch.abspath if pooch is not None else os.path.dirname(output_file)) / PARTIAL_DIR
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return directory / f'{key}.part', directory / f'{key}.json'
+
+    def __call__(self, url: str, output_file, pooch=None, check_only: bool = False):
+        with requests.Session() as session:
+            head = session.head(url, allow_redirects=True, timeout=self.timeout)
+            if check_only:
+                return head.status_code == 200
+
+            size = int(head.headers.get('Content-Length', 0))
+            ranges = head.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            if head.status_code != 200 or not ranges or size < self.min_range_size:
+                return self._stream(session, url, output_file)
+
+            part_path, state_path = self._partial_paths(url, str(output_file), pooch)
+            part_path.parent.mkdir(parents=True, exist_ok=True)
+            validator = {
+                'size': size,
+                'etag': head.headers.get('ETag'),
+                'last_modified': head.headers.get('Last-Modified'),
+            }
+            done = self._load_state(state_path, validator, part_path)
+            self._download_ranges(session, head.url, part_path, state_path, validator, size, done)
+
+        if hasattr(output_file, 'write'):
+            with open(part_path, 'rb') as part:
+                shutil.copyfileobj(part, output_file)
+            part_path.unlink()
+        else:
+            os.replace(part_path, output_file)
+        state_path.unlink(missing_ok=True)
+
+    def _stream(self, session: requests.Session, url: str, output_file) -> None:
+        with session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if hasattr(output_file, 'write'):
+                shutil.copyfileobj(response.raw, output_file)
+                return
+            with open(output_file, 'wb') as file:
+                for block in response.iter_content(chunk_size=1024 ** 2):
+                    file.write(block)
+
+    def _load_state(self, state_path: Path, validator: dict, part_path: Path) -> Set[int]:
+        """
+        Chunks of a previous, interrupted download of the same file, if any.
+        """
+        try:
+            with open(state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            state = None
+
+        if state is not None and state.get('validator') == validator and part_path.exists():
+            return set(state['done'])
+
+        # Start over: preallocate the partial file so that chunks can be written in any order
+        with open(part_path, 'wb') as part:
+            part.truncate(validator['size'])
+        return set()
+
+    def _download_ranges(
+        self,
+        session: requests.Session,
+        url: str,
+        part_path: Path,
+        state_path: Path,
+        validator: dict,
+        size: int,
+        done: Set[int],
+    ) -> None:
+        lock = threading.Lock()
+        chunks = [idx for idx in range((size + self.chunk_size - 1) // self.chunk_size) if idx not in done]
+
+        def download_chunk(idx: int) -> None:
+            start = idx * self.chunk_size
+            end = min(start + self.chunk_size, size) - 1
+            headers = {'Range': f'bytes={start}-{end}'}
+            with session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise requests.HTTPError(f'Range requests are not honoured by {url}.', response=response)
+
+                with open(part_path, 'r+b') as part:
+                    part.seek(start)
+                    written = 0
+                    for block in response.iter_content(chunk_size=1024 ** 2):
+                        part.write(block)
+                        written += len(block)
+            if written != end - start + 1:
+                raise requests.ConnectionError(f'Incomplete chunk {idx} of {url}.')
+
+            with lock:
+                done.add(idx)
+                self._save_state(state_path, validator, done)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for future in [executor.submit(download_chunk, idx) for idx in chunks]:
+                future.result()
+
+    @staticmethod
+    def _save_state(state_path: Path, validator: dict, done: Set[int]) -> None:
+        tmp_path = state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'validator': validator, 'done': sorted(done)}, file)
+        os.replace(tmp_path, state_path)
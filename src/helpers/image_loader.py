@@ -0,0 +1,66 @@
+"""
+Loading of the dataset images with the fastest backend for each file.
+
+- Uncompressed TIFFs stored contiguously are memory-mapped (read-only): no copy
+  is made, and the kernels reading the same file share its pages in the OS cache.
+- Compressed TIFFs are decoded by tifffile, with imagecodecs, in parallel threads.
+- Other formats (PNG, JPEG...) are decoded by imagecodecs.
+
+With `lazy=True`, the image is returned as a dask array instead.
+"""
+from typing import Optional
+
+TIFF_SUFFIXES = ('.tif', '.tiff')
+
+
+def image_backend(path: str) -> str:
+    """
+    Backend used to load the image: `'memmap'`, `'tifffile'` or `'imagecodecs'`.
+    """
+    if not str(path).lower().endswith(TIFF_SUFFIXES):
+        return 'imagecodecs'
+
+    import tifffile
+
+    with tifffile.TiffFile(path) as tif:
+        # The offset of the series is only known if its data is uncompressed and contiguous
+        return 'memmap' if tif.series[0].dataoffset is not None else 'tifffile'
+
+
+def load_image(path: str, lazy: bool = False, max_workers: Optional[int] = None):
+    """
+    Read an image as a numpy array (a read-only `numpy.memmap` when possible), or as a dask array if `lazy`.
+
+    `max_workers` is the number of threads decoding a compressed TIFF (by default, half the CPUs).
+    """
+    backend = image_backend(path)
+
+    if backend == 'memmap':
+        import tifffile
+
+        image = tifffile.memmap(path, mode='r')
+        if lazy:
+            import dask.array as da
+
+            return da.from_array(image, chunks='auto')
+        return image
+
+    if backend == 'tifffile':
+        import tifffile
+
+        if lazy:
+            import dask.array as da
+            import zarr
+
+            return da.from_zarr(zarr.open(tifffile.imread(path, aszarr=True), mode='r'))
+        return tifffile.imread(path, maxworkers=max_workers)
+
+    import imagecodecs
+
+    image = imagecodecs.imread(path)
+    if lazy:
+        import dask.array as da
+
+        # These formats cannot be decoded by parts
+        return da.from_array(image, chunks='auto')
+    return image
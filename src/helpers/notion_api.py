@@ -1,131 +1,277 @@
 import requests
 import os
+import queue
+import threading
+import time
+import warnings
 import pandas as pd
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from helpers.notion_schema import NotionSchema
+from helpers.rendering import render_links, render_tag_buttons
+from helpers.notion_client import get_client
+from helpers.timing import stage
+from helpers.notion_cache import (
+    is_fresh, last_edited_time, load_snapshot, merge_pages, needs_full_sync, save_snapshot, snapshot_path,
+)
 
 ONLINE_RESOURCES_DATABASE_ID = "b056be0b6f22499eb08c0d466c082686"
 SOFTWARE_TOOLS_DATABASE_ID = "043e925d562a4d688d83fd8f6a2aad07"
 
+# Columns extracted from each database. Only the pages with the `Field guide` box ticked are kept.
+ONLINE_RESOURCES_SCHEMA = NotionSchema(
+    columns={
+        'Name': ('Name', 'title'),
+        'Link': ('Link', 'url'),
+        'Keywords': ('Keywords', 'multi_select'),
+        'Favourite': ('Favourite', 'checkbox'),
+    },
+    include='Field guide',
+)
+
+SOFTWARE_TOOLS_SCHEMA = NotionSchema(
+    columns={
+        'Software tool': ('Software tool', 'title'),
+        'Description': ('Description', 'rich_text'),
+        'Homepage': ('Homepage', 'url'),
+        'Used for': ('Used for', 'multi_select'),
+        'Keywords': ('Keywords', 'multi_select'),
+        'Favourite': ('Favourite', 'checkbox'),
+    },
+    include='Field guide',
+)
+
+# Maximum page size allowed by the Notion API
+PAGE_SIZE = 100
+
+# How often the background thread paging through a database checks whether its consumer stopped, in seconds
+STOP_POLL_INTERVAL = 0.1
+
+def get_dataframes() -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fetch the online resources and software tools databases concurrently.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        online_resources = executor.submit(get_online_resources_dataframe)
+        software_tools = executor.submit(get_software_tools_dataframe)
+        return online_resources.result(), software_tools.result()
+
 def get_online_resources_dataframe() -> pd.DataFrame:
-    online_resources_data = query_notion_database(ONLINE_RESOURCES_DATABASE_ID)
-    items = parse_online_resources(online_resources_data)
-    df = pd.DataFrame(items)
+    with stage('notion_sync', database='online_resources') as timing:
+        pages, rows = sync_and_parse(ONLINE_RESOURCES_DATABASE_ID, ONLINE_RESOURCES_SCHEMA)
+        timing['rows'] = len(pages)
 
-    df["Name"] = [
-        '<a href="{}">{}</a>'.format(link, name)
-        for link, name in zip(df["Link"], df["Name"])
-    ]
+    with stage('parse', database='online_resources') as timing:
+        df = pd.DataFrame(ONLINE_RESOURCES_SCHEMA.to_columns(rows))
+        timing['rows'] = len(df)
+
+    with stage('render', database='online_resources', rows=len(df)):
+        return render_online_resources(df)
+
+def render_online_resources(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Render the parsed online resources as HTML links and tag buttons, in place.
+    """
+    df["Name"] = render_links(df["Link"], df["Name"])
 
     df.drop('Link', axis='columns', inplace=True)
 
-    df["Keywords"] = [
-        ''.join(['<button class="btn btn-light btn-xs" onclick="function()" style="padding: 1px; margin: 4px 2px; font-size: 12px;">{}</button>'.format(keyword) for keyword in [kw for kw in str(keywords).split(', ') if kw != 'nan']])
-        for keywords in df["Keywords"]
-    ]
+    # Raw keyword lists, used to build the tag index of the filters
+    df["_keywords"] = df["Keywords"]
+
+    df["Keywords"] = render_tag_buttons(df["_keywords"])
 
     return df
 
 def get_software_tools_dataframe() -> pd.DataFrame:
-    software_tools_data = query_notion_database(SOFTWARE_TOOLS_DATABASE_ID)
-    items = parse_software_tools(software_tools_data)
-    df = pd.DataFrame(items)
+    with stage('notion_sync', database='software_tools') as timing:
+        pages, rows = sync_and_parse(SOFTWARE_TOOLS_DATABASE_ID, SOFTWARE_TOOLS_SCHEMA)
+        timing['rows'] = len(pages)
 
-    df["Software tool"] = [
-        '<a href="{}">{}</a>'.format(link, name)
-        for link, name in zip(df["Homepage"], df["Software tool"])
-    ]
+    with stage('parse', database='software_tools') as timing:
+        df = pd.DataFrame(SOFTWARE_TOOLS_SCHEMA.to_columns(rows))
+        timing['rows'] = len(df)
+
+    with stage('render', database='software_tools', rows=len(df)):
+        return render_software_tools(df)
+
+def render_software_tools(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Render the parsed software tools as HTML links and tag buttons, in place.
+    """
+    df["Software tool"] = render_links(df["Homepage"], df["Software tool"])
 
     df.drop(['Homepage'], axis='columns', inplace=True)
 
-    df["Used for"] = [
-        ''.join(['<button class="btn btn-light btn-xs" onclick="function()" style="padding: 1px; margin: 4px 2px; font-size: 12px;">{}</button>'.format(keyword) for keyword in [kw for kw in str(keywords).split(', ') if kw != 'nan']])
-        for keywords in df["Used for"]
-    ]
+    # Raw keyword lists, used to build the tag index of the filters
+    df["_used_for"] = df["Used for"]
+    df["_keywords"] = df["Keywords"]
 
-    df["Keywords"] = [
-        ''.join(['<button class="btn btn-light btn-xs" onclick="function()" style="padding: 1px; margin: 4px 2px; font-size: 12px;">{}</button>'.format(keyword) for keyword in [kw for kw in str(keywords).split(', ') if kw != 'nan']])
-        for keywords in df["Keywords"]
-    ]
+    df["Used for"] = render_tag_buttons(df["_used_for"])
+    df["Keywords"] = render_tag_buttons(df["_keywords"])
 
     return df
 
-def parse_online_resources(data: dict) -> List[dict]:
-    """Extract data from the raw Notion database contents."""
-    items = []
-
-    for page_contents in data.get('results'):
-        page_title = page_contents['properties']['Name']['title'][0]['plain_text']
-        page_url = page_contents['properties']['Link']['url']
-        all_keywords = [keyword['name'] for keyword in page_contents['properties']['Keywords']['multi_select']]
-        all_keywords = ', '.join(all_keywords)
-
-        # Only keep the data for the field guide
-        field_guide_include = page_contents['properties']['Field guide']['checkbox']
-        if not field_guide_include:
-            continue
-
-        is_favourite = page_contents['properties']['Favourite']['checkbox']
-
-        items.append({
-            'Name': page_title,
-            'Link': page_url,
-            'Keywords': all_keywords,
-            'Favourite': is_favourite
-        })
-
-    return items
-
-def parse_software_tools(data: dict) -> List[dict]:
-    """
-    Extract data from the raw Notion database contents.
-    """
-    items = []
-
-    for page_contents in data.get('results'):
-        page_name = page_contents['properties']['Software tool']['title'][0]['plain_text']
-        page_description = page_contents['properties']['Description']['rich_text'][0]['plain_text']
-        page_url = page_contents['properties']['Homepage']['url']
-        all_page_usage = [usage['name'] for usage in page_contents['properties']['Used for']['multi_select']]
-        all_page_usage = ', '.join(all_page_usage)
-        all_page_keywords = [keywords['name'] for keywords in page_contents['properties']['Keywords']['multi_select']]
-        all_page_keywords = ', '.join(all_page_keywords)
-        
-        # Only keep the data for the field guide
-        field_guide_include = page_contents['properties']['Field guide']['checkbox']
-        if not field_guide_include:
-            continue
-
-        is_favourite = page_contents['properties']['Favourite']['checkbox']
-
-        items.append({
-            "Software tool": page_name,
-            "Description": page_description,
-            "Homepage": page_url,
-            "Used for": all_page_usage,
-            "Keywords": all_page_keywords,
-            "Favourite": is_favourite
-        })
-
-    return items
-
-def query_notion_database(database_id: str) -> dict:
-    """
-    Query the Notion API to retreive the content of a database.
-    """
-    response = requests.post(
-        url=f"https://api.notion.com/v1/databases/{database_id}/query",
-        headers={
-            "Notion-Version": "2022-06-28",
-            "Authorization": f"Bearer {os.environ['NOTION_KEY']}",
-            "Content-Type": "application/json"
-        },
-    )
-
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    else:
-        print(f'Error: {response.status_code} - {response.text}')
+def parse_online_resources(data: dict) -> Dict[str, list]:
+    """Extract the columns of the online resources from the raw Notion database contents."""
+    return ONLINE_RESOURCES_SCHEMA.parse(data.get('results'))
+
+def parse_software_tools(data: dict) -> Dict[str, list]:
+    """
+    Extract the columns of the software tools from the raw Notion database contents.
+    """
+    return SOFTWARE_TOOLS_SCHEMA.parse(data.get('results'))
+
+def sync_and_parse(database_id: str, schema: NotionSchema) -> Tuple[List[dict], List[Optional[list]]]:
+    """
+    Sync a database and parse its pages with `schema.parse_page`. Returns the pages and their rows.
+
+    The pages received from Notion are parsed as each API response arrives, while
+    the next one is downloading; only the unchanged pages of the snapshot are left
+    to parse once the sync is over.
+    """
+    parsed: Dict[Tuple[str, str], Optional[list]] = {}
+
+    def parse_pages(pages: List[dict]) -> None:
+        for page in pages:
+            parsed[page['id'], page['last_edited_time']] = schema.parse_page(page)
+
+    pages = sync_notion_database(database_id, schema, on_pages=parse_pages)
+    rows = [
+        parsed[page['id'], page['last_edited_time']] if (page['id'], page['last_edited_time']) in parsed
+        else schema.parse_page(page)
+        for page in pages
+    ]
+    return pages, rows
+
+def sync_notion_database(
+    database_id: str,
+    schema: NotionSchema,
+    full: bool = False,
+    on_pages: Optional[Callable[[List[dict]], None]] = None,
+) -> List[dict]:
+    """
+    Bring the local snapshot of a database up to date and return its pages.
+
+    Only the pages edited since the last snapshot are requested from Notion and
+    merged in; `full=True` (or `NOTION_FULL_SYNC=1`) downloads the whole database
+    again, which also forgets deleted pages. As the incremental queries do not
+    return deleted pages, a full sync also runs when the last one is older than
+    `NOTION_FULL_SYNC_MAX_AGE` (a day by default). The snapshot is served as is when it
+    is recent enough, when `NOTION_KEY` is not set or when the API fails, unless it
+    was written with a different schema: a `RuntimeError` is raised then, as its
+    pages lack the properties of the current one.
+
+    Pages are pruned to the properties of the `schema` as each API response
+    arrives, then passed to `on_pages`; a snapshot written with a different
+    schema triggers a full sync.
+    """
+    snapshot = load_snapshot(database_id)
+    snapshot_pages = {} if snapshot is None else snapshot['pages']
+    outdated_schema = snapshot is not None and snapshot.get('schema') != schema.fingerprint
+    full = full or os.environ.get('NOTION_FULL_SYNC') == '1' or outdated_schema or needs_full_sync(snapshot)
+
+    def fallback(reason: str) -> List[dict]:
+        if outdated_schema:
+            raise RuntimeError(
+                f'{reason}, and the local snapshot of database {database_id} was written with a different schema: '
+                f'sync it again (with NOTION_KEY set and Notion reachable) or delete {snapshot_path(database_id)}.'
+            )
+        return list(snapshot_pages.values())
+
+    if not full and is_fresh(snapshot):
+        return list(snapshot_pages.values())
+
+    if 'NOTION_KEY' not in os.environ:
+        if snapshot is None:
+            warnings.warn(f'NOTION_KEY is not set and there is no local snapshot of database {database_id}.')
+        return fallback('NOTION_KEY is not set')
+
+    started_at = time.time()
+    pages = {} if full else dict(snapshot_pages)
+    since = last_edited_time(pages)
+    query_filter = None
+    if since is not None:
+        query_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+
+    try:
+        for data in iter_notion_database(database_id, query_filter=query_filter):
+            new_pages = [schema.prune(page) for page in data['results']]
+            merge_pages(pages, new_pages)
+            if on_pages is not None:
+                on_pages(new_pages)
+    except requests.RequestException as error:
+        if not outdated_schema:
+            warnings.warn(f'Could not query Notion database {database_id} ({error}), using the local snapshot.')
+        return fallback(f'Could not query Notion database {database_id} ({error})')
+
+    save_snapshot(database_id, pages, schema.fingerprint, started_at if full else snapshot['full_synced_at'])
+
+    return list(pages.values())
+
+def iter_notion_database(database_id: str, query_filter: Optional[dict] = None) -> Iterator[dict]:
+    """
+    Yield the pages of a Notion database as they are received.
+
+    The database is paged through following `has_more` / `next_cursor`. The next
+    page is requested in a background thread while the caller processes the
+    current one, so that parsing overlaps with waiting on the network. The thread
+    stops after its current request when the caller stops iterating early.
+    """
+    pages = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # Give up when the consumer is gone, instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=STOP_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch_pages():
+        try:
+            start_cursor = None
+            while not stop.is_set():
+                data = query_notion_database(database_id, start_cursor=start_cursor, query_filter=query_filter)
+                if not put(data) or not data.get('has_more'):
+                    break
+                start_cursor = data.get('next_cursor')
+        except Exception as error:
+            put(error)
+        finally:
+            put(done)
+
+    threading.Thread(target=fetch_pages, daemon=True).start()
+
+    try:
+        while True:
+            data = pages.get()
+            if data is done:
+                return
+            if isinstance(data, Exception):
+                raise data
+            yield data
+    finally:
+        stop.set()
+
+def query_notion_database(database_id: str, start_cursor: Optional[str] = None, query_filter: Optional[dict] = None) -> dict:
+    """
+    Query the Notion API to retreive one page of the content of a database.
+
+    Raises a `requests.RequestException` if the query fails.
+    """
+    payload = {"page_size": PAGE_SIZE}
+    if start_cursor is not None:
+        payload["start_cursor"] = start_cursor
+    if query_filter is not None:
+        payload["filter"] = query_filter
+
+    return get_client().query_database(database_id, payload)
 
 
 if __name__ == "__main__":
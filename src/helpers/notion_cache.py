@@ -0,0 +1,73 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Directory holding one JSON snapshot per Notion database ID
+NOTION_CACHE_DIR = Path(os.environ.get(
+    'NOTION_CACHE',
+    Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'field-guide' / 'notion'
+))
+
+# Snapshots younger than this (in seconds) are served without asking Notion for updates
+NOTION_CACHE_MAX_AGE = float(os.environ.get('NOTION_CACHE_MAX_AGE', 300))
+
+# Incremental syncs do not see the pages deleted in Notion: the whole database is downloaded
+# again when the last full sync of the snapshot is older than this (in seconds)
+NOTION_FULL_SYNC_MAX_AGE = float(os.environ.get('NOTION_FULL_SYNC_MAX_AGE', 24 * 3600))
+
+def snapshot_path(database_id: str) -> Path:
+    return NOTION_CACHE_DIR / f'{database_id}.json'
+
+def load_snapshot(database_id: str) -> Optional[dict]:
+    """
+    Read the local snapshot of a database, or return `None` if there is none.
+    """
+    path = snapshot_path(database_id)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def save_snapshot(database_id: str, pages: Dict[str, dict], schema: str, full_synced_at: float) -> None:
+    """
+    Write the snapshot of a database atomically, keyed by page ID.
+    """
+    path = snapshot_path(database_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({
+            'database_id': database_id,
+            'synced_at': time.time(),
+            'schema': schema,
+            'full_synced_at': full_synced_at,
+            'pages': pages,
+        }, file)
+    os.replace(tmp_path, path)
+
+def is_fresh(snapshot: Optional[dict]) -> bool:
+    return snapshot is not None and time.time() - snapshot.get('synced_at', 0) < NOTION_CACHE_MAX_AGE
+
+def needs_full_sync(snapshot: Optional[dict]) -> bool:
+    return snapshot is None or time.time() - snapshot.get('full_synced_at', 0) >= NOTION_FULL_SYNC_MAX_AGE
+
+def last_edited_time(pages: Dict[str, dict]) -> Optional[str]:
+    """
+    Most recent `last_edited_time` among the pages of a snapshot.
+
+    Notion timestamps are ISO 8601 strings in UTC, so they sort lexicographically.
+    """
+    return max((page['last_edited_time'] for page in pages.values()), default=None)
+
+def merge_pages(pages: Dict[str, dict], new_pages: List[dict]) -> None:
+    """
+    Merge freshly queried pages into a snapshot, by page ID.
+
+    Database queries do not return the archived or trashed pages: they are only
+    forgotten by a full sync.
+    """
+    for page in new_pages:
+        pages[page['id']] = page
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from helpers.notion_cache import NOTION_CACHE_DIR
+from helpers.timing import stage
+
+NOTION_API_URL = os.environ.get('NOTION_API_URL', 'https://api.notion.com/v1')
+NOTION_VERSION = "2022-06-28"
+
+# Notion allows an average of three requests per second per integration token
+NOTION_RATE_LIMIT = float(os.environ.get('NOTION_RATE_LIMIT', 3))
+
+# (connect, read) timeouts in seconds
+NOTION_TIMEOUT = (
+    float(os.environ.get('NOTION_CONNECT_TIMEOUT', 5)),
+    float(os.environ.get('NOTION_READ_TIMEOUT', 30)),
+)
+
+NOTION_MAX_RETRIES = int(os.environ.get('NOTION_MAX_RETRIES', 5))
+
+# Status codes worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing `rate` calls per second, with bursts of up to `capacity` calls.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket kept in a file locked with `flock`, shared by all the processes using the same
+    file, such as the kernels executing the notebooks of a build in parallel. Falls back to a
+    bucket of its own process if the file cannot be written.
+    """
+    def __init__(self, path: str, rate: float, capacity: Optional[float] = None):
+        super().__init__(rate, capacity)
+        self.path = path
+
+    def acquire(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._lock, open(self.path, 'a+') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                # Wall clock time, comparable between processes
+                now = time.time()
+                file.seek(0)
+                try:
+                    tokens, updated = json.loads(file.read())
+                except ValueError:
+                    tokens, updated = self.capacity, now
+                tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate) - 1
+                file.seek(0)
+                file.truncate()
+                json.dump([tokens, now], file)
+        except OSError:
+            return super().acquire()
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+_BUCKETS: Dict[str, TokenBucket] = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def _token_bucket(token: str, rate: float) -> TokenBucket:
+    # Clients sharing an integration token share its rate limit, across processes where `flock` is available
+    with _BUCKETS_LOCK:
+        if token not in _BUCKETS:
+            if fcntl is not None:
+                name = hashlib.sha256(token.encode()).hexdigest()[:16]
+                _BUCKETS[token] = SharedTokenBucket(str(NOTION_CACHE_DIR / f'rate-limit-{name}.json'), rate)
+            else:
+                _BUCKETS[token] = TokenBucket(rate)
+        return _BUCKETS[token]
+
+
+class NotionClient:
+    """
+    Client for the Notion API with a pooled HTTP session.
+
+    Requests are paced by a token bucket shared by all the clients using the same
+    token, in all the processes (e.g. the parallel kernels of `build_tools.build_book`).
+    Throttled (429) and failed (5xx, connection errors, timeouts) requests are
+    retried with jittered exponential backoff, honouring `Retry-After`.
+    """
+    def __init__(
+        self,
+        token: str,
+        base_url: str = NOTION_API_URL,
+        timeout: Tuple[float, float] = NOTION_TIMEOUT,
+        max_retries: int = NOTION_MAX_RETRIES,
+        rate_limit: float = NOTION_RATE_LIMIT,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._bucket = _token_bucket(token, rate_limit)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Notion-Version": NOTION_VERSION,
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        })
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            try:
+                return float(retry_after) + random.uniform(0, self.backoff)
+            except ValueError:
+                pass
+        # Full jitter: spread out the clients that failed at the same time
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def post(self, path: str, payload: dict) -> requests.Response:
+        """
+        POST `payload` to the API and return the response, retrying transient failures.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            time.sleep(self._retry_delay(attempt, response))
+
+        return response
+
+    def query_database(self, database_id: str, payload: dict) -> dict:
+        """
+        Query one page of a database. Raises a `requests.RequestException` if the query fails.
+        """
+        with stage('notion_query', database=database_id) as timing:
+            response = self.post(f"databases/{database_id}/query", payload)
+            timing['bytes'] = len(response.content)
+            timing['status'] = response.status_code
+
+            if response.status_code != 200:
+                print(f'Error: {response.status_code} - {response.text}')
+                response.raise_for_status()
+
+            data = response.json()
+            timing['rows'] = len(data.get('results', []))
+
+        return data
+
+
+_CLIENTS: Dict[str, NotionClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(token: Optional[str] = None) -> NotionClient:
+    """
+    Shared client for `token` (by default, the `NOTION_KEY` environment variable).
+    """
+    token = token if token is not None else os.environ['NOTION_KEY']
+    with _CLIENTS_LOCK:
+        if token not in _CLIENTS:
+            _CLIENTS[token] = NotionClient(token)
+        return _CLIENTS[token]
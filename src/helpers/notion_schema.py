@@ -0,0 +1,77 @@
+import hashlib
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def _plain_text(rich_text: List[dict]) -> str:
+    return ''.join(fragment['plain_text'] for fragment in rich_text)
+
+
+# How to read the value of each type of Notion property
+PROPERTY_EXTRACTORS: Dict[str, Callable] = {
+    'title': _plain_text,
+    'rich_text': _plain_text,
+    'url': lambda url: url,
+    'checkbox': bool,
+    'multi_select': lambda options: [option['name'] for option in options],
+}
+
+
+class NotionSchema:
+    """
+    Declarative description of the columns to extract from a Notion database.
+
+    `columns` maps each output column to a `(property name, property type)` pair
+    and `include` names the checkbox property deciding which pages are kept. The
+    spec is compiled once into a list of extractors; the inclusion checkbox is
+    read first, so excluded pages are skipped without being parsed.
+    """
+    def __init__(self, columns: Dict[str, Tuple[str, str]], include: str):
+        self.columns = columns
+        self.include = include
+        self._extractors = [
+            (column, property_name, property_type, PROPERTY_EXTRACTORS[property_type])
+            for column, (property_name, property_type) in columns.items()
+        ]
+        self.properties = [include] + [property_name for property_name, _ in columns.values()]
+        self.fingerprint = hashlib.sha1(
+            json.dumps([columns, include], sort_keys=True).encode()
+        ).hexdigest()
+
+    def is_included(self, page: dict) -> bool:
+        return bool(page['properties'][self.include]['checkbox'])
+
+    def prune(self, page: dict) -> dict:
+        """
+        Keep only the parts of a Notion page that the schema (and the snapshot) needs.
+        """
+        return {
+            'id': page['id'],
+            'last_edited_time': page['last_edited_time'],
+            'properties': {name: page['properties'][name] for name in self.properties},
+        }
+
+    def parse_page(self, page: dict) -> Optional[list]:
+        """
+        Values of the columns of a page, in the order of `columns`, or `None` if it is not included.
+        """
+        if not self.is_included(page):
+            return None
+        properties = page['properties']
+        return [
+            extract(properties[property_name][property_type])
+            for _, property_name, property_type, extract in self._extractors
+        ]
+
+    def to_columns(self, rows: Iterable[Optional[list]]) -> Dict[str, list]:
+        """
+        Gather rows returned by `parse_page` as one list per column, skipping the excluded pages.
+        """
+        rows = [row for row in rows if row is not None]
+        return {column: [row[index] for row in rows] for index, column in enumerate(self.columns)}
+
+    def parse(self, pages: Iterable[dict]) -> Dict[str, list]:
+        """
+        Extract the columns of the included pages, as one list per column.
+        """
+        return self.to_columns(self.parse_page(page) for page in pages)
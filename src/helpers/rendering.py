@@ -0,0 +1,87 @@
+import json
+import uuid
+from functools import lru_cache
+from typing import Dict, Iterable, List, Sequence
+
+import pandas as pd
+from itables import options as itables_options
+
+TAG_BUTTON_TEMPLATE = '<button class="btn btn-light btn-xs" onclick="function()" style="padding: 1px; margin: 4px 2px; font-size: 12px;">{}</button>'
+LINK_TEMPLATE = '<a href="{}">{}</a>'
+
+# Rows created at once by the deferred tables
+DEFERRED_PAGE_LENGTH = 25
+
+# The rows are loaded from the shared data source, and only created when displayed (`deferRender`).
+# `bindTagButtons` (`_static/input_fnct.js`) binds the tag buttons of the rows drawn.
+DEFERRED_TABLE_TEMPLATE = '''<table id="{table_id}" class="{classes}" style="{style}"></table>
+<link href="{css_url}" rel="stylesheet">
+<script type="module">
+    import DataTable from '{js_url}';
+    const rows = {rows};
+    new DataTable('#{table_id}', Object.assign({options}, {{
+        ajax: {{url: '{url}', cache: true, dataSrc: json => rows.map(row => json.data[row])}},
+        drawCallback: function () {{ window.bindTagButtons?.(this.api().table().container()); }},
+    }}));
+</script>'''
+
+
+@lru_cache(maxsize=None)
+def render_tag_button(keyword: str) -> str:
+    return TAG_BUTTON_TEMPLATE.format(keyword)
+
+
+def render_tag_buttons(keyword_lists: Iterable[Sequence[str]]) -> pd.Categorical:
+    """
+    Render lists of keywords as rows of tag buttons, in a single pass.
+
+    Each distinct keyword is formatted once and each distinct combination of
+    keywords is joined once; the cells are returned as a categorical so that
+    rows sharing the same tags also share the same string.
+    """
+    categories: Dict[tuple, int] = {}
+    codes: List[int] = []
+    for keywords in keyword_lists:
+        key = tuple(keywords)
+        code = categories.get(key)
+        if code is None:
+            code = categories[key] = len(categories)
+        codes.append(code)
+
+    rendered = [''.join(map(render_tag_button, key)) for key in categories]
+
+    return pd.Categorical.from_codes(codes, categories=pd.Index(rendered, dtype=object))
+
+
+def render_links(urls: Iterable[str], names: Iterable[str]) -> List[str]:
+    return [LINK_TEMPLATE.format(url, name) for url, name in zip(urls, names)]
+
+
+def render_deferred_table(url: str, rows: Sequence[int], columns: Sequence[str], classes: str = 'display',
+                          style: str = '', showIndex: bool = False, **options) -> str:
+    """
+    HTML of a DataTable showing the `rows` of the JSON data source at `url`, with deferred rendering.
+
+    Accepts the arguments of `itables.show`. Paging is enabled, so that only the displayed rows are created.
+    """
+    options = {
+        'columns': [{'title': column} for column in columns],
+        'order': [],
+        **options,
+        'deferRender': True,
+        'paging': True,
+        'pageLength': DEFERRED_PAGE_LENGTH,
+    }
+    if 'dom' in options and 'p' not in options['dom']:
+        # Keep the paging control
+        options['dom'] += 'p'
+    return DEFERRED_TABLE_TEMPLATE.format(
+        table_id=f'field-guide-table-{uuid.uuid4().hex[:8]}',
+        classes=classes,
+        style=style,
+        css_url=itables_options.dt_url.replace('.js', '.css'),
+        js_url=itables_options.dt_url,
+        rows=json.dumps([int(row) for row in rows]),
+        options=json.dumps(options),
+        url=url,
+    )
@@ -0,0 +1,35 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set
+
+
+class TagIndex:
+    """
+    Inverted index from a keyword to the positions of the rows tagged with it.
+
+    Keywords are matched exactly, so that a tag like "Segmentation" does not
+    select rows that are only tagged "Instance segmentation".
+    """
+    def __init__(self, *keyword_columns: Iterable[List[str]]):
+        self._rows: Dict[str, Set[int]] = defaultdict(set)
+        for column in keyword_columns:
+            for row, keywords in enumerate(column):
+                for keyword in keywords:
+                    self._rows[keyword].add(row)
+
+    def keywords(self) -> List[str]:
+        return sorted(self._rows)
+
+    def rows(self, tags: Iterable[str], match: str = 'any') -> List[int]:
+        """
+        Sorted positions of the rows tagged with any (union) or all (intersection) of `tags`.
+        """
+        if match not in ('any', 'all'):
+            raise ValueError(f"match must be 'any' or 'all', not {match!r}")
+
+        row_sets = [self._rows.get(tag, set()) for tag in tags]
+        if not row_sets:
+            return []
+
+        if match == 'any':
+            return sorted(set().union(*row_sets))
+        return sorted(set.intersection(*row_sets))
@@ -0,0 +1,96 @@
+"""
+Optional per-stage timing instrumentation of the helpers.
+
+Timings are recorded while the `FIELD_GUIDE_TIMINGS` environment variable names
+a file (one JSON record is appended per line, so that the kernels of a whole
+book build can write to the same file) or inside a `record_timings()` block.
+Otherwise `stage` does nothing but yield its fields.
+
+Each record holds the stage name, its wall time in seconds, the process ID, the
+working directory (the page being executed during a book build) and any field
+set by the instrumented code, such as `rows`, `bytes` or `database`.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+TIMINGS_FILE = os.environ.get('FIELD_GUIDE_TIMINGS')
+
+_collectors: List[List[dict]] = []
+_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return TIMINGS_FILE is not None or bool(_collectors)
+
+
+def _emit(record: dict) -> None:
+    with _lock:
+        for collector in _collectors:
+            collector.append(record)
+        if TIMINGS_FILE is not None:
+            # A single write of one line, so that concurrent processes do not interleave records
+            with open(TIMINGS_FILE, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + '\n')
+
+
+@contextmanager
+def stage(name: str, **fields) -> Iterator[dict]:
+    """
+    Time the enclosed block. Fields added to the yielded dict are recorded with it.
+    """
+    if not is_enabled():
+        yield fields
+        return
+
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        _emit({
+            'stage': name,
+            'seconds': time.perf_counter() - start,
+            'pid': os.getpid(),
+            'cwd': os.getcwd(),
+            **fields,
+        })
+
+
+@contextmanager
+def record_timings() -> Iterator[List[dict]]:
+    """
+    Collect the timing records of the enclosed block into the yielded list.
+    """
+    records: List[dict] = []
+    with _lock:
+        _collectors.append(records)
+    try:
+        yield records
+    finally:
+        with _lock:
+            _collectors.remove(records)
+
+
+def load_timings(path: str) -> List[dict]:
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def summarize_timings(records: Iterable[dict], key: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Aggregate records per stage (or per `(stage, record[key])`): count, total and maximum wall time, rows and bytes.
+    """
+    summary: Dict[str, dict] = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows': 0, 'bytes': 0})
+    for record in records:
+        name = record['stage'] if key is None else f"{record['stage']} [{record.get(key)}]"
+        entry = summary[name]
+        entry['count'] += 1
+        entry['seconds'] += record['seconds']
+        entry['max_seconds'] = max(entry['max_seconds'], record['seconds'])
+        entry['rows'] += record.get('rows') or 0
+        entry['bytes'] += record.get('bytes') or 0
+    return dict(summary)
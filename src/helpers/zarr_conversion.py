@@ -0,0 +1,112 @@
+"""
+Conversion of the TIFF files of the dataset to chunked, compressed OME-Zarr.
+
+The conversion runs once per layout (axes and chunks), next to the TIFF in the
+dataset cache, and reads the TIFF one page (or tile) at a time, so that it never
+holds the whole image in memory. The converted image is then opened as a lazy
+dask array: reading a slice only decodes the chunks it overlaps.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional
+
+# Chunk size along each OME axis (clipped to the image shape)
+DEFAULT_CHUNKS = {'t': 1, 'c': 1, 'z': 16, 'y': 512, 'x': 512}
+
+OME_AXES = 'tczyx'
+
+# TIFF axes (as reported by tifffile) to OME axes. Stacks of unknown meaning are read as Z.
+TIFF_AXES = {'T': 't', 'C': 'c', 'S': 'c', 'Z': 'z', 'Q': 'z', 'I': 'z', 'Y': 'y', 'X': 'x'}
+
+
+def zarr_path(tiff_path: str, axes: Optional[str] = None, chunks: Optional[Dict[str, int]] = None) -> Path:
+    """
+    Path of the OME-Zarr copy of a TIFF file. A copy with other axes or chunks than the defaults
+    is named after a hash of them, so that each layout gets its own copy.
+    """
+    path = Path(tiff_path)
+    chunks = {**DEFAULT_CHUNKS, **(chunks or {})}
+    if axes is None and chunks == DEFAULT_CHUNKS:
+        return path.with_name(f'{path.stem}.ome.zarr')
+    layout = hashlib.sha1(json.dumps([axes, chunks], sort_keys=True).encode()).hexdigest()[:8]
+    return path.with_name(f'{path.stem}.{layout}.ome.zarr')
+
+
+def ome_axes(tiff_axes: str) -> str:
+    """
+    OME axes of a TIFF series, e.g. `'yxc'` for `'YXS'`. Raises a `ValueError` if they cannot be mapped.
+    """
+    axes = ''.join(TIFF_AXES.get(axis, '?') for axis in tiff_axes)
+    if '?' in axes or len(set(axes)) != len(axes):
+        raise ValueError(f"Cannot map the TIFF axes '{tiff_axes}' to OME axes, pass them as `axes`.")
+    return axes
+
+
+def convert_tiff_to_ome_zarr(tiff_path: str, output_path: str, axes: Optional[str] = None, chunks: Optional[Dict[str, int]] = None) -> None:
+    """
+    Write the first series of a TIFF file as a (multiscale) OME-Zarr image, with the axes in OME order.
+    """
+    import dask.array as da
+    import tifffile
+    import zarr
+    from ome_zarr.writer import write_image
+
+    chunks = {**DEFAULT_CHUNKS, **(chunks or {})}
+    with tifffile.TiffFile(tiff_path) as tif:
+        series = tif.series[0]
+        axes = axes or ome_axes(series.axes)
+        image = da.from_zarr(zarr.open(series.aszarr(), mode='r'))
+
+        order = sorted(range(len(axes)), key=lambda idx: OME_AXES.index(axes[idx]))
+        image = image.transpose(order)
+        axes = ''.join(axes[idx] for idx in order)
+        chunk_shape = tuple(min(chunks[axis], size) for axis, size in zip(axes, image.shape))
+
+        tmp_path = f'{output_path}.{os.getpid()}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        write_image(
+            image=image.rechunk(chunk_shape),
+            group=zarr.open_group(tmp_path, mode='w'),
+            axes=axes,
+            storage_options=dict(chunks=chunk_shape),
+        )
+
+    shutil.rmtree(output_path, ignore_errors=True)
+    os.replace(tmp_path, output_path)
+
+
+def open_ome_zarr(path: str, level: int = 0):
+    """
+    Lazy dask array of one resolution level (0 is the full resolution) of an OME-Zarr image.
+    """
+    import dask.array as da
+    import zarr
+
+    attrs = zarr.open_group(str(path), mode='r').attrs
+    # OME-NGFF 0.5 nests the metadata in an `ome` attribute
+    multiscales = attrs['ome']['multiscales'] if 'ome' in attrs else attrs['multiscales']
+    return da.from_zarr(str(path), component=multiscales[0]['datasets'][level]['path'])
+
+
+class ConvertToOmeZarr:
+    """
+    Pooch processor converting a fetched TIFF file to OME-Zarr and returning the path of the converted image.
+
+    The conversion runs when the file is downloaded or updated, or if the converted image with
+    these axes and chunks is missing or older than the file.
+    """
+    def __init__(self, axes: Optional[str] = None, chunks: Optional[Dict[str, int]] = None):
+        self.axes = axes
+        self.chunks = chunks
+
+    def __call__(self, fname: str, action: str, pooch) -> str:
+        output_path = zarr_path(fname, self.axes, self.chunks)
+        if (
+            action != 'fetch' or not output_path.exists()
+            or output_path.stat().st_mtime < Path(fname).stat().st_mtime
+        ):
+            convert_tiff_to_ome_zarr(fname, str(output_path), self.axes, self.chunks)
+        return str(output_path)
@@ -1,11 +1,6 @@
-import pooch
+import sys
+from pathlib import Path
 
-DATASET = pooch.create(
-    path=pooch.os_cache("field-guide"),  # default path
-    base_url="https://zenodo.org/record/8099852/files/",
-    registry={
-    },
-    env="SHARED_DATA",  # if exists, will overwrite `path`
-    urls={
-    },
-)
+# The datasets of all the sections are registered in `src/helpers/datasets.py`
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from helpers.datasets import DATASET
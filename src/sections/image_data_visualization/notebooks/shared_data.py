@@ -1,14 +1,6 @@
-import pooch
+import sys
+from pathlib import Path
 
-DATASET = pooch.create(
-    path=pooch.os_cache("field-guide"),  # default path
-    base_url="https://zenodo.org/record/8099852/files/",
-    registry={
-        "grains.tif": "md5:38b46d0a9c1b7ca9c866c2a11138a65a",
-        "drosophila_trachea.tif": "md5:d595ac271779936e255afd0508cca43f",
-    },
-    env="SHARED_DATA",  # if exists, will overwrite `path`
-    # # Specify custom URLs for some of the files in the registry.
-    urls={
-    },
-)
+# The datasets of all the sections are registered in `src/helpers/datasets.py`
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from helpers.datasets import DATASET
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The datasets of all the sections are registered in `src/helpers/datasets.py`
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+from helpers.datasets import DATASET